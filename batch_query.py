@@ -0,0 +1,104 @@
+"""Send a question list to a running rag_api through /query/batch.
+
+    python batch_query.py top_questions.txt --output answers.jsonl
+    python batch_query.py bench/questions.jsonl --chunk-size 100
+
+Use it to pre-warm the semantic cache with the most common support questions,
+or to collect answers for offline evaluation. Questions go out in chunks of
+``--chunk-size``; each answer is written to ``--output`` as one JSON line.
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+from typing import List, Tuple
+
+import httpx
+
+DEFAULT_URL = "http://127.0.0.1:8000"
+MAX_RETRY_WAIT = 60  # Longest pause before re-sending busy questions, whatever Retry-After says
+
+
+def load_questions(path: str) -> List[str]:
+    """One question per line, or JSONL with a "question" field"""
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and path.endswith(".jsonl"):
+                line = json.loads(line).get("question", "").strip()
+            if line:
+                questions.append(line)
+    return questions
+
+
+def post_chunk(client: httpx.Client, url: str, chunk: List[str], retries: int) -> Tuple[List[dict], Counter]:
+    """Answer one chunk; questions rejected because LM Studio was busy are re-sent after Retry-After"""
+    results = [None] * len(chunk)
+    summary = Counter()
+    pending = list(range(len(chunk)))
+    for attempt in range(retries + 1):
+        response = client.post(f"{url}/query/batch", json={"questions": [chunk[i] for i in pending]})
+        body = response.json()
+        if response.status_code == 503 and attempt < retries:
+            wait = min(int(response.headers.get("Retry-After", 5)), MAX_RETRY_WAIT)
+            print(f"LM Studio busy - retrying {len(pending)} questions in {wait}s")
+            time.sleep(wait)
+            continue
+        if response.status_code != 200 or "results" not in body:
+            raise RuntimeError(body.get("error", response.status_code))
+        busy = []
+        for i, result in zip(pending, body["results"]):
+            results[i] = result
+            if result.get("busy"):
+                busy.append(i)
+        summary.update({key: value for key, value in body["summary"].items() if key not in ("questions", "seconds")})
+        if not busy or attempt == retries:
+            break
+        summary["rejected"] -= len(busy)
+        wait = min(max(result.get("retry_after", 5) for result in (results[i] for i in busy)), MAX_RETRY_WAIT)
+        print(f"{len(busy)} questions rejected as busy - retrying in {wait}s")
+        time.sleep(wait)
+        pending = busy
+    return results, +summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a list of questions through /query/batch")
+    parser.add_argument("questions", help="Text file with one question per line, or JSONL with a \"question\" field")
+    parser.add_argument("--url", default=DEFAULT_URL, help="rag_api base URL")
+    parser.add_argument("--chunk-size", type=int, default=50, help="Questions per /query/batch request")
+    parser.add_argument("--output", help="Write one JSON result per line here")
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds to wait for one chunk")
+    parser.add_argument("--retries", type=int, default=5, help="Times to re-send questions rejected because LM Studio was busy")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    totals = Counter()
+    started = time.perf_counter()
+    output = open(args.output, "w") if args.output else None
+    try:
+        with httpx.Client(timeout=args.timeout) as client:
+            for start in range(0, len(questions), args.chunk_size):
+                chunk = questions[start:start + args.chunk_size]
+                try:
+                    results, summary = post_chunk(client, args.url, chunk, args.retries)
+                except RuntimeError as e:
+                    sys.exit(f"Batch starting at question {start + 1} failed: {e}")
+                for result in results:
+                    if output:
+                        output.write(json.dumps(result) + "\n")
+                totals.update(summary)
+                print(
+                    f"{start + len(chunk)}/{len(questions)} questions "
+                    f"({', '.join(f'{key} {value}' for key, value in sorted(summary.items()))})"
+                )
+    finally:
+        if output:
+            output.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s: " + ", ".join(f"{key} {value}" for key, value in sorted(totals.items())))
+
+
+if __name__ == "__main__":
+    main()
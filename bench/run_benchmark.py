@@ -0,0 +1,267 @@
+"""Load and ingest benchmarks against the stub server in bench/stub_server.py.
+
+    python bench/run_benchmark.py load --concurrency 8 --repeat 3
+    python bench/run_benchmark.py crawl --max-depth 3 --refresh
+    python bench/run_benchmark.py thresholds --url http://127.0.0.1:1234/v1
+
+``load`` replays a question workload against a running rag_api and reports
+throughput, latency percentiles and cache hit ratios; ``crawl`` runs the
+crawler in a scratch directory and reports pages/sec and chunks/sec;
+``thresholds`` embeds labeled question pairs with the real embedding model and
+reports the distances the semantic cache thresholds are chosen from.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.jsonl")
+DEFAULT_PAIRS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_pairs.jsonl")
+METRIC_LINE = re.compile(r'^rag_cache_lookups_total\{cache="(\w+)",result="(\w+)"\} ([0-9.e+-]+)$')
+
+
+def load_questions(path: str) -> List[str]:
+    """One question per line, or JSONL with a "question" (or "title") field"""
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("question") or record.get("title") or ""
+            if line:
+                questions.append(line)
+    return questions
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+    }
+
+
+async def scrape_cache_counters(client: httpx.AsyncClient, base_url: str) -> Dict[str, Dict[str, float]]:
+    """rag_cache_lookups_total from /metrics, as {cache: {result: count}} (empty if unavailable)"""
+    try:
+        response = await client.get(f"{base_url}/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    counters: Dict[str, Dict[str, float]] = {}
+    for line in response.text.splitlines():
+        if match := METRIC_LINE.match(line):
+            counters.setdefault(match[1], {})[match[2]] = float(match[3])
+    return counters
+
+
+def outcome_of(body: dict) -> str:
+    if "error" in body:
+        return "error"
+    if body.get("cache_hit"):
+        return body.get("cache_type", "cache")
+    return "coalesced" if body.get("coalesced") else "generated"
+
+
+async def send_query(client: httpx.AsyncClient, base_url: str, question: str, stream: bool) -> dict:
+    started = time.perf_counter()
+    first_event: Optional[float] = None
+    try:
+        if stream:
+            body = {}
+            async with client.stream("POST", f"{base_url}/query/stream", json={"question": question}) as response:
+                event = None
+                async for line in response.aiter_lines():
+                    if first_event is None and line:
+                        first_event = time.perf_counter() - started
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:") and event in ("done", "error"):
+                        body = json.loads(line[5:])
+        else:
+            response = await client.post(f"{base_url}/query", json={"question": question})
+            body = response.json()
+        outcome = outcome_of(body) if response.status_code == 200 else "error"
+    except (httpx.HTTPError, json.JSONDecodeError):
+        outcome = "error"
+    return {"latency": time.perf_counter() - started, "first_event": first_event, "outcome": outcome}
+
+
+async def run_load(args) -> dict:
+    questions = load_questions(args.questions)
+    workload = questions * args.repeat
+    random.Random(args.seed).shuffle(workload)
+    base_url = args.url.rstrip("/")
+    queue: asyncio.Queue = asyncio.Queue()
+    for question in workload:
+        queue.put_nowait(question)
+    results = []
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        before = await scrape_cache_counters(client, base_url)
+
+        async def worker():
+            while not queue.empty():
+                question = queue.get_nowait()
+                results.append(await send_query(client, base_url, question, args.stream))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        after = await scrape_cache_counters(client, base_url)
+
+    outcomes = Counter(result["outcome"] for result in results)
+    report = {
+        "endpoint": "/query/stream" if args.stream else "/query",
+        "requests": len(results),
+        "distinct_questions": len(set(questions)),
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency": latency_summary([result["latency"] for result in results]),
+        "outcomes": dict(outcomes),
+        "answered_from_cache": round(sum(outcomes[kind] for kind in ("exact_match", "semantic")) / len(results), 3) if results else 0.0,
+    }
+    for outcome in sorted(outcomes):
+        latencies = [result["latency"] for result in results if result["outcome"] == outcome]
+        report["latency_" + outcome] = latency_summary(latencies)
+    if args.stream:
+        report["first_event"] = latency_summary([r["first_event"] for r in results if r["first_event"] is not None])
+
+    cache_ratios = {}
+    for cache, counts in after.items():
+        hits = counts.get("hit", 0) - before.get(cache, {}).get("hit", 0)
+        misses = counts.get("miss", 0) - before.get(cache, {}).get("miss", 0)
+        if hits + misses:
+            cache_ratios[cache] = {"hits": int(hits), "misses": int(misses), "hit_ratio": round(hits / (hits + misses), 3)}
+    report["cache_hit_ratios"] = cache_ratios
+    return report
+
+
+async def run_crawl(args) -> dict:
+    """Crawl the stub's synthetic site into a scratch directory (the real chroma_data is never touched)"""
+    sys.path.insert(0, ROOT)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-crawl-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main as crawler
+        # Politeness limits cap pages/sec against a real host; lift them to measure the pipeline itself
+        if args.per_host_delay is not None:
+            crawler.PER_HOST_DELAY = args.per_host_delay
+        if args.per_host_concurrency is not None:
+            crawler.PER_HOST_CONCURRENCY = args.per_host_concurrency
+        report = {"workdir": workdir, "initial": await crawler.acrawl_and_store([args.site], args.max_depth)}
+        if args.refresh:
+            report["refresh"] = await crawler.acrawl_and_store([args.site], args.max_depth, refresh=True)
+    finally:
+        os.chdir(original_cwd)
+    return report
+
+
+async def run_thresholds(args) -> dict:
+    """Squared L2 distances (Chroma's metric) of paraphrases vs. different questions on the same topic.
+
+    Labels: ``same`` (paraphrases that should share an answer), ``related``
+    (same topic, different question - e.g. Portal vs. Server) and ``different``.
+    The suggested cache threshold keeps a margin below the closest non-paraphrase
+    pair; the near-hit band stops short of it, so a provisional answer never
+    belongs to a different question from the sample.
+    """
+    with open(args.pairs) as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    texts = sorted({pair[key] for pair in pairs for key in ("a", "b")})
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        response = await client.post(f"{args.url}/embeddings", json={"model": args.model, "input": texts})
+        response.raise_for_status()
+    vectors = {text: item["embedding"] for text, item in zip(texts, response.json()["data"])}
+
+    by_label: Dict[str, List[float]] = {}
+    for pair in pairs:
+        a, b = vectors[pair["a"]], vectors[pair["b"]]
+        by_label.setdefault(pair["label"], []).append(sum((x - y) ** 2 for x, y in zip(a, b)))
+    report = {
+        label: {"pairs": len(values), "min": round(min(values), 3), "median": round(sorted(values)[len(values) // 2], 3), "max": round(max(values), 3)}
+        for label, values in sorted(by_label.items())
+    }
+    closest_other = min(value for label, values in by_label.items() if label != "same" for value in values)
+    hit, near = round(closest_other * 0.6, 3), round(closest_other * 0.85, 3)
+    report["suggested"] = {
+        "SEMANTIC_SIMILARITY_THRESHOLD": hit,
+        "NEAR_HIT_THRESHOLD": near,
+        "paraphrases_hit": sum(value < hit for value in by_label.get("same", [])),
+        "paraphrases_near_hit": sum(hit <= value < near for value in by_label.get("same", [])),
+    }
+    return report
+
+
+def print_report(report: dict):
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG API load and crawler ingest benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="replay a question workload against a running rag_api")
+    load.add_argument("--url", default="http://127.0.0.1:8000")
+    load.add_argument("--questions", default=DEFAULT_QUESTIONS, help=".jsonl with a question/title field, or one question per line")
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--repeat", type=int, default=3, help="times each question is asked (repeats exercise the caches)")
+    load.add_argument("--seed", type=int, default=0, help="shuffle seed, for reproducible request order")
+    load.add_argument("--stream", action="store_true", help="use /query/stream and also report time to first event")
+    load.add_argument("--timeout", type=float, default=300)
+
+    crawl = commands.add_parser("crawl", help="measure crawler ingest throughput against the stub's /docs site")
+    crawl.add_argument("--site", default="http://127.0.0.1:1234/docs/index.htm")
+    crawl.add_argument("--max-depth", type=int, default=3)
+    crawl.add_argument("--refresh", action="store_true", help="follow with a --refresh pass over the same site")
+    crawl.add_argument("--per-host-delay", type=float, help="override main.PER_HOST_DELAY")
+    crawl.add_argument("--per-host-concurrency", type=int, help="override main.PER_HOST_CONCURRENCY")
+    crawl.add_argument("--workdir", help="scratch directory for chroma_data and crawl state (default: a new temp dir)")
+
+    thresholds = commands.add_parser("thresholds", help="measure question-pair distances to choose the semantic cache thresholds")
+    thresholds.add_argument("--url", default="http://127.0.0.1:1234/v1", help="LM Studio (OpenAI-compatible) base URL")
+    thresholds.add_argument("--model", default="text-embedding-nomic-embed-text-v1.5")
+    thresholds.add_argument("--pairs", default=DEFAULT_PAIRS, help=".jsonl with a, b and label (same / related / different)")
+    thresholds.add_argument("--timeout", type=float, default=120)
+
+    for command in (load, crawl, thresholds):
+        command.add_argument("--json", help="also write the report to this file")
+
+    args = parser.parse_args()
+    runners = {"load": run_load, "crawl": run_crawl, "thresholds": run_thresholds}
+    report = asyncio.run(runners[args.command](args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""OpenAI-compatible stand-in for LM Studio, plus a synthetic docs site for crawler benchmarks.
+
+    python bench/stub_server.py --port 1234 --token-delay 0.02
+
+Embeddings are deterministic (hashed bag of words, so similar questions get
+nearby vectors), chat completions stream ``<think>`` reasoning followed by a
+markdown answer at a fixed per-token delay, and ``/docs/`` serves linked
+pages with the navigation/footer boilerplate of the real ArcGIS docs.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from email.utils import formatdate
+from functools import lru_cache
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+
+app = FastAPI()
+
+# Overridden from the command line
+CONFIG = {
+    "dim": 768,
+    "embed_delay": 0.0,       # Seconds per embedding request
+    "max_batch": 0,           # Reject larger embedding batches with 413 (0 = unlimited)
+    "token_delay": 0.02,      # Seconds between streamed tokens
+    "first_token_delay": 0.2, # Prompt processing time before the first token
+    "think_tokens": 40,
+    "answer_tokens": 80,
+    "plain_answers": False,   # Answer in unformatted prose, so rag_api's formatting stage runs
+    "site_pages": 200,
+    "links_per_page": 4,
+}
+STARTED = formatdate(time.time(), usegmt=True)
+CALLS = {"embeddings": 0, "embedded_texts": 0, "chat": 0, "pages": 0}
+
+STOP_WORDS = set("a an and are can do does for how i in is it my of on or the to use used what when which with".split())
+
+# Synthetic pages cycle through these, so bench/questions.jsonl has something to retrieve
+TOPICS = [
+    "add a server machine to join an existing ArcGIS Server site",
+    "ports ArcGIS Server needs open through the firewall",
+    "configure the ArcGIS Web Adaptor",
+    "federate ArcGIS Server with Portal for ArcGIS",
+    "hosting server for ArcGIS Enterprise",
+    "configure ArcGIS Enterprise for raster analytics and image hosting",
+    "back up ArcGIS Enterprise with the webgisdr utility",
+    "register a data store with ArcGIS Server",
+    "upgrade ArcGIS Enterprise to the latest release",
+    "ArcGIS Data Store relational and tile cache stores",
+    "enable HTTPS and import a CA-signed certificate",
+    "high availability for Portal for ArcGIS",
+    "ArcGIS Server Administrator Directory",
+    "change the ArcGIS Server account",
+    "base ArcGIS Enterprise deployment",
+    "troubleshoot federation errors between Portal and Server",
+]
+
+
+@lru_cache(maxsize=100_000)
+def _word_vector(word: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.md5(word.encode()).digest()[:8], "big")
+    return np.random.default_rng(seed).standard_normal(CONFIG["dim"]).astype(np.float32)
+
+
+def fake_embedding(text: str) -> list:
+    """Unit-length bag of content words: texts sharing more words are closer"""
+    words = [word.strip("?.,!:;()") for word in text.lower().split()]
+    words = [word for word in words if word and word not in STOP_WORDS] or [""]
+    vector = np.sum([_word_vector(word) for word in words], axis=0)
+    return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+
+def _tokens(prefix: str, count: int) -> list:
+    return [f"{prefix}{i} " for i in range(count)]
+
+
+def completion_tokens(model: str) -> list:
+    if "granite" in model:
+        return ["## Formatted answer\n"] + [f"- {token}\n" for token in _tokens("point", CONFIG["answer_tokens"] // 2)]
+    if CONFIG["plain_answers"]:
+        sentences = [
+            "To make this change you need administrator access to the site.",
+            "First, sign in to ArcGIS Server Manager at /arcgis/manager with the primary site administrator account.",
+            "Then open Site > Machines and select the machine you want to change.",
+            "Next, edit C:\\Program Files\\ArcGIS\\Server\\framework\\etc\\config-store-connection.xml if the config store moved.",
+            "Finally, restart the ArcGIS Server service and confirm the machine reports as started.",
+        ]
+        answer = [word + " " for word in " ".join(sentences).split()][:CONFIG["answer_tokens"]]
+    else:
+        answer = ["## Answer\n"] + _tokens("step", CONFIG["answer_tokens"])
+    return ["<think>"] + _tokens("reasoning", CONFIG["think_tokens"]) + ["</think>"] + answer
+
+
+def usage_for(body: dict, tokens: list) -> dict:
+    prompt = sum(len(message.get("content", "").split()) for message in body.get("messages", []))
+    return {"prompt_tokens": prompt, "completion_tokens": len(tokens), "total_tokens": prompt + len(tokens)}
+
+
+@app.get("/v1/models")
+async def models():
+    return {"data": [{"id": "deepseek-r1-distill-qwen-7b"}, {"id": "granite-3.1-8b-instruct:2"}, {"id": "text-embedding-nomic-embed-text-v1.5"}]}
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    if CONFIG["max_batch"] and len(texts) > CONFIG["max_batch"]:
+        return JSONResponse({"error": "batch too large"}, status_code=413)
+    CALLS["embeddings"] += 1
+    CALLS["embedded_texts"] += len(texts)
+    if CONFIG["embed_delay"]:
+        await asyncio.sleep(CONFIG["embed_delay"])
+    return {"data": [{"index": i, "embedding": fake_embedding(text)} for i, text in enumerate(texts)]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    CALLS["chat"] += 1
+    tokens = completion_tokens(body.get("model", ""))
+    max_tokens = body.get("max_tokens", -1)
+    finish_reason = "stop"
+    if max_tokens and 0 < max_tokens < len(tokens):
+        tokens = tokens[:max_tokens]
+        finish_reason = "length"
+    usage = usage_for(body, tokens)
+
+    if not body.get("stream"):
+        await asyncio.sleep(CONFIG["first_token_delay"] + CONFIG["token_delay"] * len(tokens))
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": finish_reason}], "usage": usage}
+
+    async def events():
+        await asyncio.sleep(CONFIG["first_token_delay"])
+        for token in tokens:
+            yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}) + "\n\n"
+            await asyncio.sleep(CONFIG["token_delay"])
+        yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}) + "\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({"choices": [], "usage": usage}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/calls")
+async def calls():
+    return CALLS
+
+
+def page_links(index: int) -> list:
+    pages = CONFIG["site_pages"]
+    return sorted({(index * 7 + step * 13 + 1) % pages for step in range(CONFIG["links_per_page"])} - {index})
+
+
+@app.get("/docs/{name}")
+async def docs_page(name: str, request: Request):
+    """Synthetic documentation page: unique body text wrapped in repeated site chrome"""
+    index = 0 if name == "index.htm" else int(name.removeprefix("page-").removesuffix(".htm"))
+    if not 0 <= index < CONFIG["site_pages"]:
+        return Response(status_code=404)
+    etag = f'"page-{index}-{CONFIG["site_pages"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Last-Modified": STARTED})
+    CALLS["pages"] += 1
+    topic = TOPICS[index % len(TOPICS)]
+    paragraphs = "".join(f"<p>{topic.capitalize()}: step {step} of {index}.</p>" for step in range(12))
+    links = "".join(f'<li><a href="page-{link}.htm">Topic {link}</a></li>' for link in page_links(index))
+    html = (
+        f"<html lang='en'><head><title>{topic} ({index})</title>"
+        f"<meta name='description' content='Synthetic topic {index}'></head><body>"
+        "<header>ArcGIS Enterprise | Documentation | Sign in</header>"
+        "<nav><a href='index.htm'>Home</a> | Get started | Administer | Reference</nav>"
+        f"<main><h1>{topic.capitalize()}</h1>{paragraphs}<ul>{links}</ul></main>"
+        "<div class='feedback'>Feedback on this topic? Rate this page and tell us how we can improve it.</div>"
+        "<footer>Copyright Esri. All rights reserved. Privacy | Terms of use | Contact us</footer>"
+        "</body></html>"
+    )
+    return HTMLResponse(html, headers={"ETag": etag, "Last-Modified": STARTED})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LM Studio stand-in for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    for key, value in CONFIG.items():
+        if isinstance(value, bool):
+            parser.add_argument(f"--{key.replace('_', '-')}", action="store_true")
+        else:
+            parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    for key in CONFIG:
+        CONFIG[key] = getattr(args, key)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
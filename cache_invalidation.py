@@ -0,0 +1,142 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+CACHE_DEPS_FILE = "cache_deps.sqlite3"
+
+# Kinds of cache entry that depend on chunks
+ANSWER = "answer"   # Semantic cache entry id (rag_responses)
+DOCS = "docs"       # Document cache key (Redis or the in-process LRU)
+
+
+def content_version(text: str) -> str:
+    """Version of a chunk's stored text, computed the same way by the crawler and the API.
+
+    Not ``chunk_dedup.chunk_hash``: that one normalizes the text to find
+    duplicates, while any change to the stored text must count as a new version.
+    """
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class CacheDependencies:
+    """Which cache entries were built from which chunk versions, and which chunks changed since.
+
+    The crawler publishes every chunk it stores or deletes with
+    ``publish_changes``; API workers poll ``stale_since`` and drop only the
+    cached answers and document-cache entries whose chunks now hold different
+    content (or are gone). The file is shared by the crawler and every API
+    worker, like the other SQLite files (WAL).
+    """
+
+    def __init__(self, path: str = CACHE_DEPS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode: every write opens its own BEGIN IMMEDIATE transaction (see _transaction)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(
+            """PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunk_versions (
+                chunk_id TEXT PRIMARY KEY,
+                content_hash TEXT,
+                seq INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS chunk_versions_seq ON chunk_versions (seq);
+            CREATE TABLE IF NOT EXISTS dependencies (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                recorded_at REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, key, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS dependencies_chunk ON dependencies (chunk_id);"""
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(dependencies)")}
+        if "recorded_at" not in columns:
+            self._db.execute("ALTER TABLE dependencies ADD COLUMN recorded_at REAL NOT NULL DEFAULT 0")
+            self._db.execute("UPDATE dependencies SET recorded_at = ?", (time.time(),))
+        self._db.execute("CREATE INDEX IF NOT EXISTS dependencies_recorded ON dependencies (kind, recorded_at)")
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database write lock up front, so reads inside it cannot go stale"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def publish_changes(self, changes: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Record new chunk contents as (chunk_id, content_version), or (chunk_id, None) for deleted chunks.
+
+        Chunks re-stored with the content they already had are not counted as
+        changes. Returns the sequence number entries are invalidated up to.
+        """
+        with self._transaction():
+            seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM chunk_versions").fetchone()[0]
+            self._db.executemany(
+                """INSERT INTO chunk_versions (chunk_id, content_hash, seq) VALUES (?, ?, ?)
+                ON CONFLICT (chunk_id) DO UPDATE SET content_hash = excluded.content_hash, seq = excluded.seq
+                WHERE chunk_versions.content_hash IS NOT excluded.content_hash""",
+                ((chunk_id, content_hash, seq) for chunk_id, content_hash in changes),
+            )
+        return seq
+
+    def record(self, kind: str, keys: Sequence[str], chunks: Sequence[Tuple[str, str]]) -> bool:
+        """Remember that the entries under ``keys`` were built from these (chunk_id, content_version) pairs.
+
+        Returns False (recording nothing) if one of the chunks has already
+        changed since it was read - the caller should not cache the entry.
+        The check and the insert share one transaction, so a crawler commit
+        cannot slip in between them.
+        """
+        with self._transaction():
+            for chunk_id, content_hash in chunks:
+                row = self._db.execute("SELECT content_hash FROM chunk_versions WHERE chunk_id = ?", (chunk_id,)).fetchone()
+                if row is not None and row[0] != content_hash:
+                    return False
+            self._db.executemany("DELETE FROM dependencies WHERE kind = ? AND key = ?", ((kind, key) for key in keys))
+            now = time.time()
+            self._db.executemany(
+                "INSERT INTO dependencies (kind, key, chunk_id, content_hash, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                ((kind, key, chunk_id, content_hash, now) for key in keys for chunk_id, content_hash in chunks),
+            )
+        return True
+
+    def stale_since(self, seq: int) -> Tuple[List[Tuple[str, str]], int]:
+        """(kind, key) of entries built from chunks that changed after ``seq``, and the sequence number to poll from next"""
+        with self._lock:
+            latest = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM chunk_versions").fetchone()[0]
+            if latest <= seq:
+                return [], seq
+            rows = self._db.execute(
+                """SELECT DISTINCT d.kind, d.key FROM chunk_versions c JOIN dependencies d ON d.chunk_id = c.chunk_id
+                WHERE c.seq > ? AND c.seq <= ? AND (c.content_hash IS NULL OR c.content_hash != d.content_hash)""",
+                (seq, latest),
+            ).fetchall()
+        return rows, latest
+
+    def forget(self, entries: Sequence[Tuple[str, str]]):
+        """Drop the dependencies of (kind, key) entries that were invalidated or evicted"""
+        if not entries:
+            return
+        with self._transaction():
+            self._db.executemany("DELETE FROM dependencies WHERE kind = ? AND key = ?", entries)
+
+    def expire(self, kind: str, max_age_seconds: float) -> int:
+        """Drop dependencies recorded longer ago than the cache's TTL (their entries expired on their own)"""
+        with self._transaction():
+            cursor = self._db.execute(
+                "DELETE FROM dependencies WHERE kind = ? AND recorded_at < ?", (kind, time.time() - max_age_seconds)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,40 @@
+import logging
+import os
+from typing import Optional
+from urllib.parse import urlparse
+
+# Unset: each process opens ./chroma_data and ./semantic_cache_data itself (single worker).
+# Set (e.g. http://127.0.0.1:8001 for `chroma run --path ./chroma_data --port 8001`): every
+# API worker and the crawler share the collections served by one Chroma server.
+CHROMA_SERVER_URL = os.environ.get("CHROMA_SERVER_URL", "")
+DOCS_COLLECTION = "langchain"   # langchain_chroma's default name, used by the existing chroma_data
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_client():
+    """Shared HttpClient for the configured Chroma server (created on first use)"""
+    global _client
+    if _client is None:
+        import chromadb
+
+        url = urlparse(CHROMA_SERVER_URL)
+        _client = chromadb.HttpClient(
+            host=url.hostname or "localhost",
+            port=url.port or (443 if url.scheme == "https" else 8000),
+            ssl=url.scheme == "https",
+        )
+        logger.info("🗄️ Using Chroma server at %s", CHROMA_SERVER_URL)
+    return _client
+
+
+def open_store(persist_directory: str, embedding_function, collection_name: Optional[str] = None):
+    """A langchain Chroma store: from the shared server when CHROMA_SERVER_URL is set, else embedded on disk"""
+    from langchain_chroma import Chroma  # Imported on first use - chromadb is slow to import
+
+    collection_name = collection_name or DOCS_COLLECTION
+    if CHROMA_SERVER_URL:
+        return Chroma(collection_name=collection_name, embedding_function=embedding_function, client=get_client())
+    return Chroma(collection_name=collection_name, embedding_function=embedding_function, persist_directory=persist_directory)
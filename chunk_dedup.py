@@ -0,0 +1,139 @@
+import hashlib
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+SHINGLE_SIZE = 5          # Words per shingle for near-duplicate detection
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16            # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_chunk(text: str) -> str:
+    """Whitespace and case differences never make two chunks distinct"""
+    return " ".join(text.split()).lower()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_chunk(text).encode()).hexdigest()
+
+
+def _shingles(text: str) -> set:
+    words = normalize_chunk(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, using seeded universal hash permutations"""
+
+    def __init__(self, permutations: int = MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = random.Random(seed)
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(permutations)]
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+            for shingle in _shingles(text)
+        ]
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._params)
+
+    @staticmethod
+    def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the two shingle sets"""
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class ChunkDeduplicator:
+    """Drops chunks whose text (or, optionally, near-identical text) is already stored for another page.
+
+    Exact duplicates are found by hashing the whitespace/case-normalized text;
+    near duplicates by MinHash signatures bucketed with LSH banding. Each
+    fingerprint remembers the page that owns it, so a page being re-crawled
+    never counts its own previous chunks as duplicates. When the owner stops
+    producing a chunk its ownership is released, and the next page with the
+    same chunk stores it instead. Thread-safe.
+    """
+
+    def __init__(self, near_duplicate_threshold: Optional[float] = None):
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._owners: Dict[str, str] = {}   # chunk hash -> source url
+        self._owned: Dict[str, Set[str]] = {}  # source url -> chunk hashes it owns
+        self._signatures: Dict[str, Tuple[int, ...]] = {}  # chunk hash -> MinHash signature (this run only)
+        self._minhasher = MinHasher() if near_duplicate_threshold else None
+        self._rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[Tuple[str, Tuple[int, ...]]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def _near_duplicate_owner(self, source: str, signature: Tuple[int, ...]) -> Optional[str]:
+        for key in self._bands(signature):
+            for owner, candidate in self._buckets.get(key, ()):
+                if owner != source and MinHasher.similarity(signature, candidate) >= self.near_duplicate_threshold:
+                    return owner
+        return None
+
+    def _add(self, source: str, digest: str, signature: Optional[Tuple[int, ...]]):
+        if self._owners.setdefault(digest, source) != source:
+            return
+        self._owned.setdefault(source, set()).add(digest)
+        if signature is not None and digest not in self._signatures:
+            self._signatures[digest] = signature
+            for key in self._bands(signature):
+                self._buckets.setdefault(key, []).append((source, signature))
+
+    def _release(self, source: str, keep: Set[str]):
+        for digest in self._owned.get(source, set()) - keep:
+            self._owned[source].discard(digest)
+            del self._owners[digest]
+            signature = self._signatures.pop(digest, None)
+            if signature is not None:
+                for key in self._bands(signature):
+                    entries = self._buckets[key]
+                    entries.remove((source, signature))
+                    if not entries:
+                        del self._buckets[key]
+        if not self._owned.get(source, True):
+            del self._owned[source]
+
+    def release(self, source: str):
+        """Forget every chunk owned by a page whose chunks were all deleted"""
+        with self._lock:
+            self._release(source, set())
+
+    def seed(self, entries: Iterable[Tuple[str, str]]):
+        """Register already-stored (source, text) chunks by exact hash (near-duplicate index covers this run only)"""
+        with self._lock:
+            for source, text in entries:
+                self._add(source, chunk_hash(text), None)
+
+    def filter(self, source: str, texts: List[str]) -> List[int]:
+        """Register a page's chunks and return the indices of those that are not duplicates.
+
+        Chunks the page owned but no longer produces are released, since the
+        crawler deletes them once the page is stored.
+        """
+        fingerprints = [
+            (chunk_hash(text), self._minhasher.signature(text) if self._minhasher else None)
+            for text in texts
+        ]
+        keep, seen = [], set()
+        with self._lock:
+            self._release(source, {digest for digest, _ in fingerprints})
+            for index, (digest, signature) in enumerate(fingerprints):
+                owner = self._owners.get(digest)
+                if digest in seen or (owner is not None and owner != source):
+                    continue
+                seen.add(digest)
+                if owner is None and signature is not None and self._near_duplicate_owner(source, signature):
+                    continue
+                self._add(source, digest, signature)
+                keep.append(index)
+        return keep
@@ -0,0 +1,118 @@
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+CHARS_PER_TOKEN = 4       # Rough average for English docs text with the Qwen/DeepSeek tokenizer
+SEPARATOR_TOKENS = 1      # "\n\n" between context blocks
+MIN_OVERLAP_CHARS = 20    # Shorter suffix/prefix matches are coincidence, not splitter overlap
+MAX_OVERLAP_CHARS = 200   # The crawler splits with a 50-char overlap
+
+_QUESTION_CLASSES = [
+    ("troubleshooting", re.compile(r"\b(errors?|fail(s|ed|ing|ure)?|not working|troubleshoot\w*|issues?|problems?|can't|cannot|unable|broken)\b", re.I)),
+    ("procedural", re.compile(r"^(how (do|can|should|to)|steps?\b|configure|install|set ?up|enable|create|upgrade|migrate|add|register|deploy)|\bhow to\b", re.I)),
+    ("factual", re.compile(r"^(which|what (port|ports|version|is the default))|\b(ports?|versions?|default|requirements?)\b", re.I)),
+    ("conceptual", re.compile(r"^(what (is|are)|why|explain|describe|when should)|\bdifference\b", re.I)),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def classify_question(question: str) -> str:
+    """Coarse question class used to pick a generation length cap"""
+    question = question.strip()
+    for name, pattern in _QUESTION_CLASSES:
+        if pattern.search(question):
+            return name
+    return "general"
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of ``first`` that starts ``second`` (splitter overlap)"""
+    for size in range(min(MAX_OVERLAP_CHARS, len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+class _Block:
+    """Consecutive text from one source, ranked by its most relevant chunk"""
+
+    __slots__ = ("source", "text", "rank", "first_index", "last_index")
+
+    def __init__(self, source: str, text: str, rank: int, index: Optional[int]):
+        self.source = source
+        self.text = text
+        self.rank = rank
+        self.first_index = self.last_index = index
+
+    def absorb(self, text: str, rank: int) -> bool:
+        """Merge text that is contained in, or overlaps either end of, this block"""
+        if text in self.text:
+            pass
+        elif size := _overlap(self.text, text):
+            self.text += text[size:]
+        elif size := _overlap(text, self.text):
+            self.text = text + self.text[size:]
+        else:
+            return False
+        self.rank = min(self.rank, rank)
+        return True
+
+
+def merge_chunks(docs: list) -> List[_Block]:
+    """Merge same-source chunks that are neighbours (by ``chunk_index``) or overlap, ordered by relevance.
+
+    ``docs`` must already be in relevance order (best first), as retrieval returns them.
+    """
+    by_source: Dict[str, list] = {}
+    for rank, doc in enumerate(docs):
+        text = doc.page_content.strip()
+        if text:
+            by_source.setdefault(doc.metadata.get("source", ""), []).append((rank, doc.metadata.get("chunk_index"), text))
+
+    blocks = []
+    for source, chunks in by_source.items():
+        source_blocks: List[_Block] = []
+        # Chunks the crawler numbered: runs of consecutive indices become one block
+        for rank, index, text in sorted((c for c in chunks if c[1] is not None), key=lambda c: c[1]):
+            last = source_blocks[-1] if source_blocks else None
+            if last is not None and index - last.last_index <= 1:
+                if not last.absorb(text, rank):
+                    last.text += "\n" + text
+                    last.rank = min(last.rank, rank)
+                last.last_index = index
+            else:
+                source_blocks.append(_Block(source, text, rank, index))
+        # Older chunks without an index: merge by overlapping text only
+        for rank, _, text in (c for c in chunks if c[1] is None):
+            if not any(block.absorb(text, rank) for block in source_blocks):
+                source_blocks.append(_Block(source, text, rank, None))
+        blocks.extend(source_blocks)
+    return sorted(blocks, key=lambda block: block.rank)
+
+
+class PackedContext(NamedTuple):
+    text: str
+    tokens: int
+    blocks: int
+    dropped: int
+
+
+def pack_context(docs: list, token_budget: int) -> PackedContext:
+    """Merged chunks in relevance order, packed greedily into ``token_budget`` estimated tokens.
+
+    A block that does not fit is skipped (a smaller, less relevant one may
+    still fit); only a single over-budget top block is truncated.
+    """
+    blocks = merge_chunks(docs)
+    packed, used = [], 0
+    for block in blocks:
+        cost = estimate_tokens(block.text) + SEPARATOR_TOKENS
+        if used + cost <= token_budget:
+            packed.append(block.text)
+            used += cost
+        elif not packed:
+            packed.append(block.text[:token_budget * CHARS_PER_TOKEN])
+            used = token_budget
+    return PackedContext("\n\n".join(packed), used, len(packed), len(blocks) - len(packed))
@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from typing import List, NamedTuple, Optional, Tuple
+
+CRAWL_STATE_FILE = "crawl_state.sqlite3"
+CRAWL_FRONTIER_FILE = "crawl_frontier.sqlite3"
+CHECKPOINT_CHANGES = 100    # Frontier changes buffered before a commit...
+CHECKPOINT_SECONDS = 10.0   # ...or seconds, whichever comes first
+MAX_FETCH_ATTEMPTS = 3      # Runs that retry a page whose fetch or storage failed
+
+# Frontier statuses
+QUEUED = "queued"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"         # Not HTML, or removed upstream - not fetched again unless re-checked
+
+
+class PageState(NamedTuple):
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+    chunk_ids: List[str]
+    fetched_at: float
+
+
+class CrawlState:
+    """Per-URL validators, content hash and stored chunk ids for incremental re-crawls"""
+
+    def __init__(self, path: str = CRAWL_STATE_FILE):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                chunk_ids TEXT NOT NULL DEFAULT '[]',
+                fetched_at REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[PageState]:
+        row = self._db.execute(
+            "SELECT url, etag, last_modified, content_hash, chunk_ids, fetched_at FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return PageState(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5])
+
+    def urls(self) -> List[str]:
+        return [row[0] for row in self._db.execute("SELECT url FROM pages")]
+
+    def record(self, url: str, etag: Optional[str], last_modified: Optional[str], content_hash: str, chunk_ids: List[str]):
+        self._db.execute(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, chunk_ids, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, json.dumps(chunk_ids), time.time()),
+        )
+        self._db.commit()
+
+    def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Page checked and unchanged - refresh its validators and fetch time"""
+        self._db.execute(
+            "UPDATE pages SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), fetched_at = ? WHERE url = ?",
+            (etag, last_modified, time.time(), url),
+        )
+        self._db.commit()
+
+    def remove(self, url: str):
+        self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class CrawlFrontier:
+    """Persistent crawl frontier: every discovered URL with its depth and status.
+
+    Changes are committed in checkpoints (every CHECKPOINT_CHANGES changes or
+    CHECKPOINT_SECONDS), so an interrupted crawl loses at most the last few
+    seconds of discoveries. On open, pages left in progress and pages that
+    failed fewer than MAX_FETCH_ATTEMPTS times are queued again, so the next
+    run resumes where the previous one stopped. ``crawled_at`` is set once a
+    page is stored, which makes the table the crawler's visited set as well.
+    """
+
+    def __init__(self, path: str = CRAWL_FRONTIER_FILE):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                crawled_at REAL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status, depth);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"""
+        )
+        self._db.execute(
+            "UPDATE frontier SET status = ? WHERE status = ? OR (status = ? AND attempts < ?)",
+            (QUEUED, IN_PROGRESS, FAILED, MAX_FETCH_ATTEMPTS),
+        )
+        self._db.commit()
+        self._queue = deque(self._db.execute("SELECT url, depth FROM frontier WHERE status = ? ORDER BY depth, updated_at", (QUEUED,)))
+        self.resumed = len(self._queue)
+        self._changes = 0
+        self._checkpointed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        """URLs waiting to be fetched"""
+        return len(self._queue)
+
+    def _status(self, url: str) -> Optional[str]:
+        row = self._db.execute("SELECT status FROM frontier WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= CHECKPOINT_CHANGES or time.monotonic() - self._checkpointed_at >= CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def add(self, url: str, depth: int, revisit: bool = False) -> bool:
+        """Queue a URL unless it is already queued or known (``revisit`` re-queues finished pages once)"""
+        status = self._status(url)
+        if status in (QUEUED, IN_PROGRESS) or (status is not None and not revisit):
+            return False
+        self._db.execute(
+            """INSERT INTO frontier (url, depth, status, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET depth = excluded.depth, status = excluded.status, updated_at = excluded.updated_at""",
+            (url, depth, QUEUED, time.time()),
+        )
+        self._queue.append((url, depth))
+        self._changed()
+        return True
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        """Next (url, depth) to fetch, marked in progress until finish() (None when nothing is queued)"""
+        if not self._queue:
+            return None
+        url, depth = self._queue.popleft()
+        self._db.execute("UPDATE frontier SET status = ?, updated_at = ? WHERE url = ?", (IN_PROGRESS, time.time(), url))
+        self._changed()
+        return url, depth
+
+    def finish(self, url: str, status: str):
+        """Record the outcome of a fetch: DONE (stored), SKIPPED or FAILED (retried on a later run)"""
+        now = time.time()
+        if status == DONE:
+            self._db.execute(
+                "UPDATE frontier SET status = ?, attempts = 0, crawled_at = ?, updated_at = ? WHERE url = ?", (DONE, now, now, url)
+            )
+        elif status == FAILED:
+            self._db.execute(
+                "UPDATE frontier SET status = ?, attempts = attempts + 1, updated_at = ? WHERE url = ?", (FAILED, now, url)
+            )
+        else:
+            self._db.execute("UPDATE frontier SET status = ?, crawled_at = NULL, updated_at = ? WHERE url = ?", (status, now, url))
+        self._changed()
+
+    def is_crawled(self, url: str) -> bool:
+        row = self._db.execute("SELECT crawled_at FROM frontier WHERE url = ?", (url,)).fetchone()
+        return bool(row and row[0] is not None)
+
+    def crawled_urls(self) -> List[str]:
+        return [row[0] for row in self._db.execute("SELECT url FROM frontier WHERE crawled_at IS NOT NULL")]
+
+    def import_visited(self, path: str) -> Optional[int]:
+        """One-time migration of a visited.txt URL list, or None if it was imported before.
+
+        The file is left in place (it may be tracked in git); a ``meta`` row
+        records the import instead.
+        """
+        key = f"imported:{os.path.basename(path)}"
+        if self._db.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            return None
+        now = time.time()
+        with open(path) as f:
+            urls = {line.strip() for line in f if line.strip()}
+        self._db.executemany(
+            "INSERT OR IGNORE INTO frontier (url, depth, status, crawled_at, updated_at) VALUES (?, 0, ?, ?, ?)",
+            ((url, DONE, now, now) for url in urls),
+        )
+        self._db.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, str(now)))
+        self.checkpoint()
+        return len(urls)
+
+    def checkpoint(self):
+        self._db.commit()
+        self._changes = 0
+        self._checkpointed_at = time.monotonic()
+
+    def close(self):
+        self.checkpoint()
+        self._db.close()
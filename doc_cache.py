@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from text_utils import normalize_question
+
+logger = logging.getLogger(__name__)
+
+REDIS_RETRY_SECONDS = 30   # After a Redis error, serve from the local LRU this long before re-probing Redis
+BUCKET_SEED = 20240601     # Fixed hyperplanes, so every worker (and restart) buckets a vector the same way
+
+
+class DocumentCache:
+    """Retrieval results (chunk ids, best first) keyed by normalized question text.
+
+    Entries live in Redis when it is reachable and in a bounded in-process
+    LRU otherwise. With ``bucket_bits`` set, entries are also stored under a
+    sign-of-random-projection bucket of the question embedding, so differently
+    worded questions whose vectors are nearly identical share one result.
+    """
+
+    def __init__(self, redis_client=None, ttl_seconds: int = 3600, max_local_entries: int = 2048,
+                 bucket_bits: Optional[int] = None, prefix: str = "docs"):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_local_entries = max_local_entries
+        self.bucket_bits = bucket_bits
+        self.prefix = prefix
+        self._hyperplanes = None
+        self._local: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()  # key -> (expires_at, ids)
+        self._lock = threading.Lock()
+        self._redis_down = False
+        self._retry_at = 0.0
+        self._probing = False
+
+    def _text_key(self, question: str) -> str:
+        return f"{self.prefix}:q:{hashlib.sha1(normalize_question(question).encode()).hexdigest()}"
+
+    def _bucket_key(self, embedding: Sequence[float]) -> str:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self._hyperplanes is None or self._hyperplanes.shape[1] != vector.shape[0]:
+            rng = np.random.default_rng(BUCKET_SEED)
+            self._hyperplanes = rng.standard_normal((self.bucket_bits, vector.shape[0])).astype(np.float32)
+        bits = np.packbits(self._hyperplanes @ vector > 0).tobytes()
+        return f"{self.prefix}:e{self.bucket_bits}:{bits.hex()}"
+
+    def keys(self, question: str, embedding: Optional[Sequence[float]] = None) -> List[str]:
+        keys = [self._text_key(question)]
+        if self.bucket_bits and embedding is not None:
+            keys.append(self._bucket_key(embedding))
+        return keys
+
+    @property
+    def redis_available(self) -> bool:
+        """False while Redis is down; once the retry interval is up, a background ping decides when it is back"""
+        if self.redis is None:
+            return False
+        if not self._redis_down:
+            return True
+        if time.monotonic() >= self._retry_at:
+            self._start_probe()
+        return False
+
+    def check(self) -> bool:
+        """Ping Redis; on failure the local LRU serves until a later probe succeeds"""
+        if self.redis is None:
+            return False
+        try:
+            self.redis.ping()
+        except Exception as e:
+            self._redis_failed(e)
+            return False
+        if self._redis_down:
+            logger.info("✅ Redis document cache reachable again")
+            self._redis_down = False
+        return True
+
+    def _start_probe(self):
+        """Re-probe Redis off the request path, so no request waits on a connect to a dead server"""
+        with self._lock:
+            if self._probing:
+                return
+            self._probing = True
+
+        def probe():
+            try:
+                self.check()
+            finally:
+                self._probing = False
+
+        threading.Thread(target=probe, name="redis-probe", daemon=True).start()
+
+    def _redis_failed(self, e: Exception):
+        if not self._redis_down:
+            logger.warning("⚠️ Redis document cache unavailable (%s) - using the in-process cache, re-probing every %ds", e, REDIS_RETRY_SECONDS)
+        self._redis_down = True
+        self._retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def get(self, question: str, embedding: Optional[Sequence[float]] = None) -> Optional[List[str]]:
+        """Cached chunk ids for the question, or None; blocking, so call it from a worker thread"""
+        keys = self.keys(question, embedding)
+        if self.redis_available:
+            try:
+                for value in self.redis.mget(keys):
+                    if value:
+                        return json.loads(value)
+                return None
+            except Exception as e:
+                self._redis_failed(e)
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._local.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._local[key]
+                    continue
+                self._local.move_to_end(key)
+                return list(entry[1])
+        return None
+
+    def put(self, question: str, embedding: Optional[Sequence[float]], chunk_ids: List[str]):
+        keys = self.keys(question, embedding)
+        if self.redis_available:
+            try:
+                value = json.dumps(chunk_ids)
+                pipe = self.redis.pipeline()
+                for key in keys:
+                    pipe.setex(key, self.ttl_seconds, value)
+                pipe.execute()
+                return
+            except Exception as e:
+                self._redis_failed(e)
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key in keys:
+                self._local[key] = (expires_at, list(chunk_ids))
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def delete(self, question: str, embedding: Optional[Sequence[float]] = None):
+        """Drop a stale entry (e.g. one of its chunks was deleted by a re-crawl)"""
+        self.delete_keys(self.keys(question, embedding))
+
+    def delete_keys(self, keys: Sequence[str]):
+        if not keys:
+            return
+        if self.redis_available:
+            try:
+                self.redis.delete(*keys)
+            except Exception as e:
+                self._redis_failed(e)
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if self.redis_available else "local",
+            "local_entries": len(self._local),
+            "bucket_bits": self.bucket_bits,
+        }
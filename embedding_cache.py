@@ -0,0 +1,75 @@
+import logging
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+from text_utils import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Process-wide LRU of question embeddings keyed by normalized text.
+
+    When a path is given, entries are written through to a small SQLite file
+    and the most recent ones are reloaded on startup, so popular questions
+    skip the LM Studio embedding call even after a restart.
+    """
+
+    def __init__(self, max_entries: int = 4096, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")  # Several API workers may share the file
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT key, vector FROM embeddings ORDER BY rowid DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, blob in reversed(rows):
+            self._entries[key] = array("f", blob).tolist()
+        logger.info("🧮 Loaded %d cached question embeddings from %s", len(self._entries), self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = normalize_question(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, text: str, vector: List[float]):
+        """Store a vector; blocking when persistence is enabled, so call it from a worker thread"""
+        self.put_many([text], [vector])
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[List[float]]):
+        """Store several vectors with one SQLite commit"""
+        keys = [normalize_question(text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._db is not None:
+                # REPLACE gives the row a fresh rowid, so rowid order doubles as recency
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    ((key, array("f", vector).tobytes()) for key, vector in zip(keys, vectors)),
+                )
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid <= (SELECT MAX(rowid) FROM embeddings) - ?",
+                    (self.max_entries,),
+                )
+                self._db.commit()
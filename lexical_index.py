@@ -0,0 +1,175 @@
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILE = "lexical_index.sqlite3"
+BM25_K1 = 1.2                  # Term-frequency saturation
+BM25_B = 0.75                  # Document-length normalization
+MAX_TERM_DOC_FRACTION = 0.5    # Query terms in more chunks than this carry ~no weight and are skipped
+RRF_K = 60                     # Reciprocal rank fusion damping (the usual value from the RRF paper)
+
+STOP_WORDS = set(
+    "a about an and are as at be by can do does for from has have how i if in into is it its my "
+    "of on or should so that the their then there these this to use used using was what when where "
+    "which while who why will with you your".split()
+)
+# Identifiers stay whole ("arcgis-server", "server.properties", "c:/arcgis") and are also split into parts
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._:/\\-][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms without stop words; compound identifiers yield the whole token and its parts"""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part not in STOP_WORDS and (len(part) > 1 or part.isdigit()))
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """SQLite inverted index over the chunks in chroma_data, keyed by the same chunk ids.
+
+    The crawler keeps it in step with Chroma (upserts and stale-chunk deletes);
+    the API queries it next to the vector search and fuses both rankings.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL: API workers keep reading while the crawler writes
+        self._db.executescript(
+            """PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                chunk_id TEXT PRIMARY KEY,
+                source TEXT,
+                length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);"""
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT chunk_id FROM docs")]
+
+    def _delete(self, ids: Sequence[str]):
+        self._db.executemany("DELETE FROM postings WHERE chunk_id = ?", ((i,) for i in ids))
+        self._db.executemany("DELETE FROM docs WHERE chunk_id = ?", ((i,) for i in ids))
+
+    def add(self, ids: Sequence[str], sources: Sequence[str], texts: Sequence[str]):
+        """Index (or re-index) chunks; blocking, so call it from a worker thread"""
+        with self._lock:
+            self._delete(ids)
+            for chunk_id, source, text in zip(ids, sources, texts):
+                counts = Counter(tokenize(text))
+                self._db.execute(
+                    "INSERT INTO docs (chunk_id, source, length) VALUES (?, ?, ?)",
+                    (chunk_id, source, sum(counts.values())),
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    ((term, chunk_id, tf) for term, tf in counts.items()),
+                )
+            self._db.commit()
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock:
+            self._delete(ids)
+            self._db.commit()
+
+    def sync(self, ids: Sequence[str], sources: Sequence[str], texts: Sequence[str]) -> Tuple[int, int]:
+        """Make the index hold exactly these chunks: index missing ids, drop unknown ones"""
+        indexed = set(self.ids())
+        wanted = set(ids)
+        missing = [(i, s, t) for i, s, t in zip(ids, sources, texts) if i not in indexed]
+        extra = sorted(indexed - wanted)
+        if missing:
+            self.add(*zip(*missing))
+        if extra:
+            self.delete(extra)
+        return len(missing), len(extra)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top ``k`` chunk ids by BM25 score for the query terms"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        scores: Dict[str, float] = {}
+        with self._lock:
+            total, average_length = self._db.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not total:
+                return []
+            average_length = average_length or 1.0
+            for term in terms:
+                df = self._db.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not df or df > total * MAX_TERM_DOC_FRACTION:
+                    continue
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                rows = self._db.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id WHERE p.term = ?",
+                    (term,),
+                )
+                for chunk_id, tf, length in rows:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def sync_with_collection(index: BM25Index, collection) -> Tuple[int, int]:
+    """Bring the index in line with a Chroma collection (backfills chunks stored before the index existed)"""
+    stored = collection.get(include=["documents", "metadatas"])
+    return sync_documents(index, stored["ids"], stored["documents"], stored["metadatas"])
+
+
+def sync_documents(index: BM25Index, ids: Iterable[str], documents: Iterable[str], metadatas: Iterable[dict]) -> Tuple[int, int]:
+    ids, documents, metadatas = list(ids), list(documents), list(metadatas)
+    added, removed = index.sync(ids, [(metadata or {}).get("source", "") for metadata in metadatas], documents)
+    if added or removed:
+        logger.info("🔤 Lexical index synced: %d chunks indexed, %d removed", added, removed)
+    return added, removed
+
+
+if __name__ == "__main__":
+    # Build or repair the index for an existing chroma_data without re-crawling
+    from chroma_store import open_store
+    from lm_client import NomicEmbedding
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    vectorstore = open_store("./chroma_data", NomicEmbedding())
+    lexical_index = BM25Index()
+    sync_with_collection(lexical_index, vectorstore._collection)
+    logger.info("✅ Lexical index holds %d chunks", len(lexical_index))
+    lexical_index.close()
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.embeddings import Embeddings
+
+from lm_scheduler import EMBEDDING, GENERATION, LMStudioScheduler
+
+# LM Studio OpenAI-compatible endpoints (LM_STUDIO_URL points elsewhere, e.g. the bench/ stub server)
+LM_STUDIO_URL = os.environ.get("LM_STUDIO_URL", "http://127.0.0.1:1234/v1")
+CHAT_COMPLETIONS_URL = f"{LM_STUDIO_URL}/chat/completions"
+EMBEDDINGS_URL = f"{LM_STUDIO_URL}/embeddings"
+EMBEDDING_MODEL = "text-embedding-nomic-embed-text-v1.5"
+
+# Connection pool sizing - LM Studio is a single local server, so a handful of
+# keep-alive connections is plenty and avoids a TCP handshake per request
+MAX_CONNECTIONS = 8
+MAX_KEEPALIVE_CONNECTIONS = 4
+
+logger = logging.getLogger(__name__)
+
+
+class LMStudioConnectionError(Exception):
+    """LM Studio is not reachable at all (as opposed to rejecting a request)"""
+
+
+_async_client: Optional[httpx.AsyncClient] = None
+_session: Optional[requests.Session] = None
+_scheduler: Optional[LMStudioScheduler] = None
+
+
+def set_scheduler(scheduler: Optional[LMStudioScheduler]):
+    """Route async LM Studio calls through an admission scheduler (None = unlimited)"""
+    global _scheduler
+    _scheduler = scheduler
+
+
+@asynccontextmanager
+async def _scheduled(kind: str) -> AsyncIterator[None]:
+    if _scheduler is None:
+        yield
+    else:
+        async with _scheduler.slot(kind):
+            yield
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for async LM Studio calls (created on first use)"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return _async_client
+
+
+def get_session() -> requests.Session:
+    """Shared keep-alive session for sync callers (Chroma embedding functions)"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+async def close_clients():
+    """Close pooled connections on shutdown"""
+    global _async_client, _session
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+async def make_lm_studio_request(url: str, payload: dict, timeout: int = 120, max_retries: int = 2) -> httpx.Response:
+    """Make request to LM Studio with retry logic, without blocking the event loop"""
+    async with _scheduled(EMBEDDING if url == EMBEDDINGS_URL else GENERATION):
+        return await _make_lm_studio_request(url, payload, timeout, max_retries)
+
+
+async def _make_lm_studio_request(url: str, payload: dict, timeout: int, max_retries: int) -> httpx.Response:
+    client = get_async_client()
+    for attempt in range(max_retries + 1):
+        try:
+            logger.debug("🔗 LM Studio request attempt %d/%d (timeout: %ss)", attempt + 1, max_retries + 1, timeout)
+            response = await client.post(url, json=payload, timeout=timeout)
+            if response.status_code == 200:
+                return response
+            logger.warning("⚠️ LM Studio returned status %s: %s", response.status_code, response.text)
+            if attempt == max_retries:
+                raise Exception(f"LM Studio returned status {response.status_code} after {max_retries + 1} attempts")
+
+        except httpx.TimeoutException:
+            logger.warning("⏰ Timeout on attempt %d (waited %ss)", attempt + 1, timeout)
+            if attempt < max_retries:
+                wait_time = 2 ** attempt  # Exponential backoff
+                logger.info("🔄 Retrying in %s seconds...", wait_time)
+                await asyncio.sleep(wait_time)
+            else:
+                raise Exception(f"LM Studio timeout after {max_retries + 1} attempts")
+
+        except httpx.ConnectError:
+            raise LMStudioConnectionError("LM Studio server not responding - please check if it's running")
+        except Exception as e:
+            logger.warning("❌ LM Studio error on attempt %d: %s", attempt + 1, e)
+            if attempt == max_retries:
+                raise
+
+
+def make_lm_studio_request_sync(url: str, payload: dict, timeout: int = 120, max_retries: int = 2) -> requests.Response:
+    """Blocking variant of make_lm_studio_request for code running in worker threads"""
+    session = get_session()
+    for attempt in range(max_retries + 1):
+        try:
+            logger.debug("🔗 LM Studio request attempt %d/%d (timeout: %ss)", attempt + 1, max_retries + 1, timeout)
+            response = session.post(url, json=payload, timeout=timeout)
+            if response.status_code == 200:
+                return response
+            logger.warning("⚠️ LM Studio returned status %s: %s", response.status_code, response.text)
+            if attempt == max_retries:
+                raise Exception(f"LM Studio returned status {response.status_code} after {max_retries + 1} attempts")
+
+        except requests.exceptions.Timeout:
+            logger.warning("⏰ Timeout on attempt %d (waited %ss)", attempt + 1, timeout)
+            if attempt < max_retries:
+                wait_time = 2 ** attempt  # Exponential backoff
+                logger.info("🔄 Retrying in %s seconds...", wait_time)
+                time.sleep(wait_time)
+            else:
+                raise Exception(f"LM Studio timeout after {max_retries + 1} attempts")
+
+        except requests.exceptions.ConnectionError:
+            raise LMStudioConnectionError("LM Studio server not responding - please check if it's running")
+        except Exception as e:
+            logger.warning("❌ LM Studio error on attempt %d: %s", attempt + 1, e)
+            if attempt == max_retries:
+                raise
+
+
+async def stream_lm_studio_request(
+    url: str, payload: dict, timeout: int = 120, max_retries: int = 2, usage: Optional[dict] = None
+) -> AsyncIterator[str]:
+    """Stream a chat completion from LM Studio, yielding content deltas as they arrive.
+
+    Retries (with backoff) only happen before the first token - once text has
+    been relayed to the caller a failure is raised instead of restarting.
+    If a ``usage`` dict is passed, the token counts the server reports at the
+    end of the stream are stored in it, along with its ``finish_reason``
+    ("length" when ``max_tokens`` cut the completion off). With a scheduler set, the call holds a
+    generation slot from the first attempt until the stream ends.
+    """
+    async with _scheduled(GENERATION):
+        async for delta in _stream_lm_studio_request(url, payload, timeout, max_retries, usage):
+            yield delta
+
+
+async def _stream_lm_studio_request(
+    url: str, payload: dict, timeout: int, max_retries: int, usage: Optional[dict]
+) -> AsyncIterator[str]:
+    client = get_async_client()
+    payload = {**payload, "stream": True}
+    if usage is not None:
+        payload["stream_options"] = {"include_usage": True}
+    for attempt in range(max_retries + 1):
+        received_any = False
+        try:
+            logger.debug("🔗 LM Studio stream attempt %d/%d (timeout: %ss)", attempt + 1, max_retries + 1, timeout)
+            async with client.stream("POST", url, json=payload, timeout=timeout) as response:
+                if response.status_code != 200:
+                    error_text = (await response.aread()).decode(errors="replace")
+                    raise Exception(f"LM Studio returned status {response.status_code}: {error_text}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    chunk = json.loads(data)
+                    if usage is not None and chunk.get("usage"):
+                        usage.update(chunk["usage"])
+                    choices = chunk.get("choices") or [{}]
+                    if usage is not None and choices[0].get("finish_reason"):
+                        usage["finish_reason"] = choices[0]["finish_reason"]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        received_any = True
+                        yield delta
+                return
+
+        except httpx.TimeoutException:
+            logger.warning("⏰ Stream timeout on attempt %d (waited %ss)", attempt + 1, timeout)
+            if attempt < max_retries and not received_any:
+                wait_time = 2 ** attempt  # Exponential backoff
+                logger.info("🔄 Retrying in %s seconds...", wait_time)
+                await asyncio.sleep(wait_time)
+            else:
+                raise Exception(f"LM Studio timeout after {attempt + 1} attempts")
+
+        except httpx.ConnectError:
+            raise LMStudioConnectionError("LM Studio server not responding - please check if it's running")
+        except Exception as e:
+            logger.warning("❌ LM Studio stream error on attempt %d: %s", attempt + 1, e)
+            if attempt == max_retries or received_any:
+                raise
+
+
+class ThinkStreamParser:
+    """Incrementally split streamed model output into ``reasoning`` and ``answer`` pieces.
+
+    Text inside ``<think>...</think>`` is reasoning, everything else is answer.
+    A tag split across two deltas is held back until it can be recognised.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.raw = ""
+        self._pending = ""
+        self._in_think = False
+
+    @property
+    def in_reasoning(self) -> bool:
+        """True while a ``<think>`` block is open - at the end of a stream, the reasoning was cut off"""
+        return self._in_think
+
+    def feed(self, delta: str) -> List[Tuple[str, str]]:
+        self.raw += delta
+        self._pending += delta
+        pieces = []
+        while self._pending:
+            tag = self.CLOSE_TAG if self._in_think else self.OPEN_TAG
+            kind = "reasoning" if self._in_think else "answer"
+            index = self._pending.find(tag)
+            if index >= 0:
+                if index:
+                    pieces.append((kind, self._pending[:index]))
+                self._pending = self._pending[index + len(tag):]
+                self._in_think = not self._in_think
+                continue
+            # Hold back a trailing partial tag ("<thi") until the next delta
+            keep = 0
+            for size in range(min(len(tag) - 1, len(self._pending)), 0, -1):
+                if tag.startswith(self._pending[-size:]):
+                    keep = size
+                    break
+            emit = self._pending[:len(self._pending) - keep]
+            if emit:
+                pieces.append((kind, emit))
+            self._pending = self._pending[len(self._pending) - keep:]
+            break
+        return pieces
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """Emit anything still held back once the stream has ended"""
+        if not self._pending:
+            return []
+        pieces = [("reasoning" if self._in_think else "answer", self._pending)]
+        self._pending = ""
+        return pieces
+
+
+class NomicEmbedding(Embeddings):
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            payload = {"model": EMBEDDING_MODEL, "input": texts}
+            response = make_lm_studio_request_sync(
+                EMBEDDINGS_URL,
+                payload,
+                timeout=30  # Shorter timeout for embeddings
+            )
+            return [d["embedding"] for d in response.json()["data"]]
+        except Exception as e:
+            logger.error("❌ Embedding failed: %s", e)
+            raise Exception(f"Failed to generate embeddings: {str(e)}")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            payload = {"model": EMBEDDING_MODEL, "input": texts}
+            response = await make_lm_studio_request(EMBEDDINGS_URL, payload, timeout=30)
+            return [d["embedding"] for d in response.json()["data"]]
+        except Exception as e:
+            logger.error("❌ Embedding failed: %s", e)
+            raise Exception(f"Failed to generate embeddings: {str(e)}")
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING = "embedding"
+GENERATION = "generation"
+_PRIORITY = {EMBEDDING: 0, GENERATION: 1}  # Lower is served first
+DURATION_SMOOTHING = 0.2  # Weight of the latest generation in the running duration estimate
+
+QUEUE_SECONDS = REGISTRY.histogram("rag_lm_queue_seconds", "Time LM Studio calls waited for a scheduler slot", ["kind"])
+ADMISSIONS = REGISTRY.counter("rag_lm_admissions_total", "LM Studio calls by scheduler decision", ["kind", "result"])
+
+
+class SchedulerBusy(Exception):
+    """The generation queue is full; ``retry_after`` is the estimated wait in seconds"""
+
+    def __init__(self, retry_after: int, queued: int):
+        super().__init__(f"LM Studio is busy ({queued} generations queued) - retry in about {retry_after}s")
+        self.retry_after = retry_after
+        self.queued = queued
+
+
+class LMStudioScheduler:
+    """Admission control in front of LM Studio.
+
+    At most ``max_concurrent`` calls run at once and at most ``max_generations``
+    of them are chat completions, so an embedding never waits behind a long
+    generation. Waiting embeddings are always granted before waiting
+    generations. Only ``max_queue`` generations may wait; further ones are
+    rejected at once with an estimate of when a slot should free up.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_generations: int = 1, max_queue: int = 4,
+                 initial_generation_seconds: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_generations = max_generations
+        self.max_queue = max_queue
+        self.generation_seconds = initial_generation_seconds  # Running average, drives the wait estimate
+        self._running: Dict[str, int] = {EMBEDDING: 0, GENERATION: 0}
+        self._generation_starts: List[float] = []
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []  # (priority, seq, kind, future) heap
+        self._sequence = itertools.count()
+
+    def _can_run(self, kind: str) -> bool:
+        if sum(self._running.values()) >= self.max_concurrent:
+            return False
+        return kind != GENERATION or self._running[GENERATION] < self.max_generations
+
+    def queued(self, kind: str = GENERATION) -> int:
+        return sum(1 for _, _, waiter_kind, future in self._waiters if waiter_kind == kind and not future.done())
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until the generation at queue ``position`` (0 = next) should start"""
+        if self._running[GENERATION] < self.max_generations and position == 0:
+            return 0.0
+        now = time.monotonic()
+        elapsed = sorted((now - started for started in self._generation_starts), reverse=True)
+        first_free = max(self.generation_seconds - elapsed[0], 1.0) if elapsed else 0.0
+        return first_free + (position // self.max_generations) * self.generation_seconds
+
+    def check_admission(self):
+        """Raise SchedulerBusy if a new generation would find the wait queue full"""
+        if self._can_run(GENERATION) or self.queued(GENERATION) < self.max_queue:
+            return
+        retry_after = math.ceil(self.estimated_wait(self.max_queue))
+        ADMISSIONS.inc(kind=GENERATION, result="rejected")
+        logger.warning("🚦 Rejecting generation: %d queued, estimated wait %ds", self.max_queue, retry_after)
+        raise SchedulerBusy(retry_after, self.max_queue)
+
+    def _grant(self):
+        while self._waiters:
+            priority, _, kind, future = self._waiters[0]
+            if future.done():  # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_run(kind):
+                return
+            heapq.heappop(self._waiters)
+            future.set_result(self._start(kind))
+
+    def _start(self, kind: str) -> float:
+        started = time.monotonic()
+        self._running[kind] += 1
+        if kind == GENERATION:
+            self._generation_starts.append(started)
+        return started
+
+    def _finish(self, kind: str, started: float):
+        self._running[kind] -= 1
+        if kind == GENERATION:
+            self._generation_starts.remove(started)
+            duration = time.monotonic() - started
+            self.generation_seconds += DURATION_SMOOTHING * (duration - self.generation_seconds)
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, kind: str) -> AsyncIterator[None]:
+        """Hold one LM Studio slot for the duration of the block (including retries)"""
+        queued_at = time.monotonic()
+        if self._can_run(kind):  # Waiters only remain queued while their kind cannot run
+            started = self._start(kind)
+        else:
+            if kind == GENERATION:
+                self.check_admission()
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (_PRIORITY[kind], next(self._sequence), kind, future))
+            try:
+                started = await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as the waiter went away - hand the slot on
+                    self._finish(kind, future.result())
+                raise
+        ADMISSIONS.inc(kind=kind, result="admitted")
+        QUEUE_SECONDS.observe(started - queued_at, kind=kind)
+        try:
+            yield
+        finally:
+            self._finish(kind, started)
+
+    def stats(self) -> dict:
+        return {
+            "running": dict(self._running),
+            "queued": {kind: self.queued(kind) for kind in _PRIORITY},
+            "max_concurrent": self.max_concurrent,
+            "max_generations": self.max_generations,
+            "max_queue": self.max_queue,
+            "generation_seconds": round(self.generation_seconds, 1),
+        }
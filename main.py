@@ -1,145 +1,533 @@
 import os
 os.environ["USER_AGENT"] = "hackathon-ragbot/0.1"
-import requests
+import argparse
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urldefrag, urljoin, urlparse
+import httpx
 from bs4 import BeautifulSoup
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import WebBaseLoader
-from langchain.embeddings.base import Embeddings
-from typing import List
+from langchain.schema import Document
+from typing import List, Optional, Set, Tuple
 import tldextract
 
-VISITED_FILE = "visited.txt"
+from cache_invalidation import CacheDependencies, content_version
+from chroma_store import open_store
+from chunk_dedup import ChunkDeduplicator
+from crawl_state import DONE, FAILED, SKIPPED, CrawlFrontier, CrawlState, PageState
+from lexical_index import BM25Index, sync_documents
+from lm_client import (
+    EMBEDDING_MODEL,
+    EMBEDDINGS_URL,
+    LMStudioConnectionError,
+    NomicEmbedding,
+    close_clients,
+    make_lm_studio_request,
+)
+from vector_index import VECTOR_INDEX_DIR, build_index, index_dtype
 
-# Custom Nomic Embedding Wrapper (LM Studio OpenAI-compatible)
-class NomicEmbedding(Embeddings):
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        try:
-            response = requests.post(
-                "http://127.0.0.1:1234/v1/embeddings",
-                headers={"Content-Type": "application/json"},
-                json={"model": "text-embedding-nomic-embed-text-v1.5", "input": texts},
-                timeout=30
-            )
+VISITED_FILE = "visited.txt"  # Pre-frontier visited list, imported into crawl_frontier.sqlite3 once (file kept)
 
-            
-            response.raise_for_status()  # Raise an exception for bad status codes
-            
-            data = response.json()
-            print(f"API Response status: {response.status_code}")
-            print(f"Response keys: {data.keys()}")
-            
-            if "data" not in data:
-                print(f"Unexpected response format: {data}")
-                raise ValueError(f"Expected 'data' key in response, got: {list(data.keys())}")
-            
-            embeddings = [d["embedding"] for d in data["data"]]
-            print(f"Generated {len(embeddings)} embeddings with dimension {len(embeddings[0]) if embeddings else 0}")
-            return embeddings
-            
-        except requests.exceptions.ConnectionError:
-            print("❌ Cannot connect to LM Studio at 127.0.0.1:1234")
-            print("Make sure LM Studio is running with an embedding model loaded")
-            raise
-        except requests.exceptions.Timeout:
-            print("❌ Request to LM Studio timed out")
-            raise
-        except Exception as e:
-            print(f"❌ Error getting embeddings: {e}")
-            raise
+# Crawler tuning
+CRAWL_CONCURRENCY = 8        # Pages processed in parallel
+PER_HOST_CONCURRENCY = 2     # Politeness: simultaneous requests to one host
+PER_HOST_DELAY = 0.25        # Politeness: minimum seconds between request starts to one host
+REQUEST_TIMEOUT = 30
 
-    def embed_query(self, text: str) -> List[float]:
-        return self.embed_documents([text])[0]
+# Ingestion pipeline tuning
+EMBED_BATCH_SIZE = 64        # Chunks per embedding request, gathered across pages
+EMBED_BATCH_LINGER = 0.5     # Seconds to wait for a batch to fill before sending it partially full
+EMBED_WORKERS = 2            # Embedding requests in flight at once
+EMBED_TIMEOUT = 60
+CHUNK_QUEUE_SIZE = EMBED_BATCH_SIZE * 4   # Backpressure between page workers and the batcher
+WRITE_QUEUE_SIZE = 4                      # Embedded batches waiting for the Chroma writer
+NEAR_DUPLICATE_THRESHOLD = 0.9            # MinHash Jaccard estimate above which a chunk is dropped (None = exact only)
+VECTOR_INDEX_DTYPE = None                 # "int8"/"float16" to build vector_index/ for rag_api's VECTOR_BACKEND = "mmap" (an existing index is always kept current)
 
-def load_visited():
-    if not os.path.exists(VISITED_FILE):
-        return set()
-    with open(VISITED_FILE) as f:
-        return set(line.strip() for line in f.readlines())
+# Main-content extraction: page chrome that repeats on every docs page
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form", "button"]
+BOILERPLATE_PATTERN = re.compile(r"(^|[-_ ])(feedback|breadcrumbs?|sidebar|toc|cookies?|social|share|skip)([-_ ]|$)", re.I)
+MAIN_CONTENT_SELECTORS = ["main", "article", "[role=main]", "#main-content", ".main-content", "#content"]
 
-def save_visited(url):
-    with open(VISITED_FILE, 'a') as f:
-        f.write(url + "\n")
+def normalize_url(url: str) -> str:
+    """Drop #fragments so the same page is only queued once"""
+    return urldefrag(url)[0]
 
-def extract_links(html, base_url):
-    soup = BeautifulSoup(html, "html.parser")
+def extract_links(soup: BeautifulSoup, page_url: str) -> Set[str]:
     links = set()
     for tag in soup.find_all("a", href=True):
-        href = tag['href']
-        if href.startswith("http"):
-            links.add(href)
-        elif href.startswith("/"):
-            links.add(base_url + href)
+        link = normalize_url(urljoin(page_url, tag['href'].strip()))
+        if link.startswith("http"):
+            links.add(link)
     return links
 
-def should_visit(url, visited, allowed_domain):
-    if url in visited:
-        print(f"Already visited: {url}")
+def build_metadata(soup: BeautifulSoup, url: str) -> dict:
+    """Same metadata WebBaseLoader attaches, so existing chunks and new chunks look alike"""
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html := soup.find("html"):
+        metadata["language"] = html.get("lang", "No language found.")
+    return metadata
+
+def is_boilerplate(tag) -> bool:
+    if tag.attrs is None:  # already removed with a boilerplate ancestor
         return False
+    names = " ".join(tag.get("class", [])) + " " + (tag.get("id") or "")
+    return bool(BOILERPLATE_PATTERN.search(names.strip()))
+
+def extract_main_content(soup: BeautifulSoup) -> str:
+    """Text of the page's main content, without navigation, footers and feedback widgets"""
+    for tag in soup.find_all(BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(is_boilerplate):
+        tag.decompose()
+    root = next((found for selector in MAIN_CONTENT_SELECTORS if (found := soup.select_one(selector))), None)
+    root = root or soup.body or soup
+    lines = (line.strip() for line in root.get_text("\n").splitlines())
+    return "\n".join(line for line in lines if line)
+
+def parse_page(html: str, url: str) -> Tuple[Document, Set[str]]:
+    """Parse a page once for both its main text and its outgoing links"""
+    soup = BeautifulSoup(html, "html.parser")
+    links = extract_links(soup, url)
+    metadata = build_metadata(soup, url)
+    return Document(page_content=extract_main_content(soup), metadata=metadata), links
+
+def in_scope(url, allowed_domain):
     domain = tldextract.extract(url).registered_domain
     return allowed_domain in domain
 
-def crawl_and_store(seed_urls, max_depth=2):
-    print("Crawling and storing data...")
-    visited = load_visited()
-    embedding = NomicEmbedding()
+class HostThrottle:
+    """Per-host politeness: bounded concurrency plus a minimum gap between request starts"""
+
+    def __init__(self, concurrency: int, delay: float):
+        self.concurrency = concurrency
+        self.delay = delay
+        self._semaphores = {}
+        self._locks = {}
+        self._last_start = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with semaphore:
+            async with lock:
+                wait = self._last_start.get(host, 0) + self.delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._last_start[host] = time.monotonic()
+            yield
+
+async def fetch_page(client: httpx.AsyncClient, throttle: HostThrottle, url: str, known: Optional[PageState] = None) -> httpx.Response:
+    """GET a page, conditional on the validators stored by the previous crawl (if any)"""
+    headers = {}
+    if known is not None:
+        if known.etag:
+            headers["If-None-Match"] = known.etag
+        if known.last_modified:
+            headers["If-Modified-Since"] = known.last_modified
+    async with throttle.slot(url):
+        return await client.get(url, headers=headers)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def chunk_id(url: str, index: int) -> str:
+    """Stable id for the index-th chunk of a page, so re-ingesting a page overwrites its chunks"""
+    return f"{hashlib.sha1(url.encode()).hexdigest()[:16]}-{index}"
+
+# Largest batch LM Studio has accepted so far; shrinks when a batch has to be split
+_embed_batch_limit = EMBED_BATCH_SIZE
+
+async def embed_batch(texts: List[str]) -> List[List[float]]:
+    """Embed a batch, halving it recursively when LM Studio rejects or times out on the full size"""
+    global _embed_batch_limit
+    if len(texts) > _embed_batch_limit:
+        embeddings = []
+        for start in range(0, len(texts), _embed_batch_limit):
+            embeddings += await embed_batch(texts[start:start + _embed_batch_limit])
+        return embeddings
+    try:
+        response = await make_lm_studio_request(
+            EMBEDDINGS_URL,
+            {"model": EMBEDDING_MODEL, "input": texts},
+            timeout=EMBED_TIMEOUT,
+            max_retries=0  # a rejected batch is split below rather than resent as-is
+        )
+        return [d["embedding"] for d in response.json()["data"]]
+    except LMStudioConnectionError:
+        raise
+    except Exception as e:
+        if len(texts) == 1:
+            raise
+        middle = len(texts) // 2
+        _embed_batch_limit = min(_embed_batch_limit, middle)
+        print(f"✂️ Embedding batch of {len(texts)} failed ({e}) - splitting, batch limit now {_embed_batch_limit}")
+        return await embed_batch(texts[:middle]) + await embed_batch(texts[middle:])
+
+async def acrawl_and_store(seed_urls, max_depth=2, refresh=False):
+    """Crawl from seed_urls and store new pages.
+
+    With refresh=True every previously crawled page is re-checked as well:
+    conditional GETs skip pages the server reports as unchanged, pages whose
+    extracted text hashes the same are skipped, and only changed pages are
+    re-chunked and re-embedded (their stale chunks are deleted by id).
+
+    The frontier is persisted in crawl_frontier.sqlite3: an interrupted crawl
+    resumes with the pages it had discovered but not yet stored.
+    """
+    print("Refreshing knowledge base..." if refresh else "Crawling and storing data...")
+    started = time.perf_counter()
+    frontier = CrawlFrontier()
+    imported = frontier.import_visited(VISITED_FILE) if os.path.exists(VISITED_FILE) else None
+    if imported is not None:
+        print(f"📥 Migrated {imported} visited URLs from {VISITED_FILE}")
+    if frontier.resumed:
+        print(f"⏯️ Resuming {frontier.resumed} queued pages from an interrupted crawl")
+    crawl_state = CrawlState()
+    lexical_index = BM25Index()
+    # Every stored or deleted chunk is published here; rag_api drops the cache entries built from its old content
+    cache_dependencies = CacheDependencies()
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
 
-    vectorstore = Chroma(persist_directory="./chroma_data", embedding_function=embedding)
+    # Chunks are embedded by the pipeline below, the embedding function is only needed by Chroma's constructor
+    vectorstore = open_store("./chroma_data", NomicEmbedding())
+
+    # Chunks already stored count as duplicates too, so shared boilerplate is only ever embedded once
+    deduplicator = ChunkDeduplicator(NEAR_DUPLICATE_THRESHOLD)
+    stored = await asyncio.to_thread(vectorstore._collection.get, include=["documents", "metadatas"])
+    deduplicator.seed(
+        ((metadata or {}).get("source", ""), document)
+        for document, metadata in zip(stored["documents"], stored["metadatas"])
+    )
+    # The BM25 index mirrors Chroma - backfill chunks stored before it existed
+    await asyncio.to_thread(sync_documents, lexical_index, stored["ids"], stored["documents"], stored["metadatas"])
 
-    queue = [(url, 0) for url in seed_urls]
     allowed_domain = tldextract.extract(seed_urls[0]).registered_domain
+    throttle = HostThrottle(PER_HOST_CONCURRENCY, PER_HOST_DELAY)
+
+    # URLs are de-duplicated by the frontier, so each page is only queued once per run
+    def enqueue(url, depth, revisit=False):
+        url = normalize_url(url)
+        if in_scope(url, allowed_domain):
+            frontier.add(url, depth, revisit)
+
+    for url in seed_urls:
+        if frontier.is_crawled(normalize_url(url)) and not refresh:
+            print(f"Already visited: {url}")
+        enqueue(url, 0, revisit=refresh)
+    if refresh:
+        # Known pages only follow links one hop, enough to pick up pages added next to changed ones
+        known_urls = set(frontier.crawled_urls()) | set(crawl_state.urls())
+        for url in sorted(known_urls):
+            enqueue(url, max(max_depth - 1, 0), revisit=True)
+        print(f"♻️ Re-checking {len(frontier)} known pages")
+
+    # === INGESTION PIPELINE ===
+    # page workers -> chunk_queue -> batcher -> embed_queue -> embedders -> write_queue -> writer
+    chunk_queue = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    embed_queue = asyncio.Queue(maxsize=EMBED_WORKERS * 2)
+    write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    pending_chunks = {}   # url -> chunks not yet written
+    pending_pages = {}    # url -> (etag, last_modified, content_hash, chunk_ids, previous PageState)
+    failed_pages = set()
+    stats = {"pages": 0, "chunks": 0, "batches": 0, "duplicates": 0, "unchanged": 0, "changed": 0, "removed": 0}
+
+    def stored_chunk_ids(url, known):
+        if known is not None:
+            return known.chunk_ids
+        # Pages stored before crawl state existed carry random ids - find them by source
+        return vectorstore._collection.get(where={"source": url}, include=[])["ids"]
 
-    while queue:
-        url, depth = queue.pop(0)
-        if not should_visit(url, visited, allowed_domain):
-            continue
+    def delete_stale_chunks(url, known, chunk_ids):
+        stale_ids = sorted(set(stored_chunk_ids(url, known)) - set(chunk_ids))
+        if stale_ids:
+            vectorstore._collection.delete(ids=stale_ids)
+            lexical_index.delete(stale_ids)
+            cache_dependencies.publish_changes((stale_id, None) for stale_id in stale_ids)
+            print(f"🧹 Deleted {len(stale_ids)} stale chunks for {url}")
+        return stale_ids
 
+    async def finish_page(url):
+        """All chunks of a page are stored: drop its stale chunks and record its new state"""
+        etag, last_modified, page_hash, chunk_ids, known = pending_pages.pop(url)
+        stale_ids = await asyncio.to_thread(delete_stale_chunks, url, known, chunk_ids)
+        crawl_state.record(url, etag, last_modified, page_hash, chunk_ids)
+        frontier.finish(url, DONE)
+        stats["pages"] += 1
+        if known is not None or stale_ids:
+            stats["changed"] += 1
+
+    async def remove_page(url, known):
+        """The page is gone upstream - delete its chunks and forget it"""
+        await asyncio.to_thread(delete_stale_chunks, url, known, [])
+        # Chunks it shared with other pages are stored by the next page that produces them
+        deduplicator.release(url)
+        crawl_state.remove(url)
+        frontier.finish(url, SKIPPED)
+        stats["removed"] += 1
+
+    async def chunk_done(url, ok):
+        if not ok:
+            failed_pages.add(url)
+        pending_chunks[url] -= 1
+        if pending_chunks[url] == 0:
+            del pending_chunks[url]
+            if url in failed_pages:
+                pending_pages.pop(url, None)
+                frontier.finish(url, FAILED)
+                print(f"❌ Some chunks from {url} could not be stored - it will be retried next run")
+                return
+            try:
+                await finish_page(url)
+            except Exception as e:
+                # Its chunks are stored, but without crawl state the next run must process the page again
+                pending_pages.pop(url, None)
+                frontier.finish(url, FAILED)
+                print(f"❌ Failed to record {url}: {e} - it will be retried next run")
+
+    async def batcher():
+        batch = []
+        while True:
+            try:
+                item = await asyncio.wait_for(chunk_queue.get(), timeout=EMBED_BATCH_LINGER if batch else None)
+            except asyncio.TimeoutError:
+                # Nothing new arrived - send the partial batch rather than stall the embedders
+                await embed_queue.put(batch)
+                batch = []
+                continue
+            if item is None:
+                if batch:
+                    await embed_queue.put(batch)
+                for _ in range(EMBED_WORKERS):
+                    await embed_queue.put(None)
+                return
+            batch.append(item)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                await embed_queue.put(batch)
+                batch = []
+
+    async def embedder():
+        while (batch := await embed_queue.get()) is not None:
+            try:
+                embeddings = await embed_batch([chunk.page_content for _, _, chunk in batch])
+            except Exception as e:
+                print(f"❌ Failed to embed batch of {len(batch)} chunks: {e}")
+                for url, _, _ in batch:
+                    await chunk_done(url, ok=False)
+                continue
+            await write_queue.put((batch, embeddings))
+
+    def store_batch(batch, embeddings):
+        ids = [item_id for _, item_id, _ in batch]
+        documents = [chunk.page_content for _, _, chunk in batch]
+        vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=[chunk.metadata for _, _, chunk in batch],
+        )
+        lexical_index.add(ids, [url for url, _, _ in batch], documents)
+        cache_dependencies.publish_changes(zip(ids, map(content_version, documents)))
+
+    async def writer():
+        while (item := await write_queue.get()) is not None:
+            batch, embeddings = item
+            try:
+                await asyncio.to_thread(store_batch, batch, embeddings)
+                stats["chunks"] += len(batch)
+                stats["batches"] += 1
+                print(f"✅ Stored batch of {len(batch)} chunks ({stats['chunks']} total)")
+                ok = True
+            except Exception as e:
+                print(f"❌ Failed to add documents to vectorstore: {e}")
+                ok = False
+            for url, _, _ in batch:
+                await chunk_done(url, ok)
+
+    async def process(client, url, depth):
         print(f"Visiting: {url}")
+        known = crawl_state.get(url)
         try:
-            loader = WebBaseLoader(url)
-            docs = loader.load()
-            
-            if not docs:
-                print(f"No documents loaded from {url}")
-                continue
-                
+            response = await fetch_page(client, throttle, url, known)
+            if response.status_code == 304:
+                print(f"♻️ Not modified: {url}")
+                crawl_state.touch(url)
+                frontier.finish(url, DONE)
+                stats["unchanged"] += 1
+                return
+            if response.status_code in (404, 410) and (known is not None or frontier.is_crawled(url)):
+                print(f"🗑️ Page removed upstream ({response.status_code}): {url}")
+                await remove_page(url, known)
+                return
+            response.raise_for_status()
+            if "html" not in response.headers.get("content-type", "html"):
+                print(f"Skipping non-HTML content at {url}")
+                frontier.finish(url, SKIPPED)
+                return
+            doc, links = await asyncio.to_thread(parse_page, response.text, str(response.url))
         except Exception as e:
             print(f"Failed to load {url}: {e}")
-            continue
+            frontier.finish(url, FAILED)
+            return
 
-        chunks = text_splitter.split_documents(docs)
+        if depth < max_depth:
+            for link in links:
+                enqueue(link, depth + 1)
+
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        page_hash = content_hash(doc.page_content)
+        if known is not None and known.content_hash == page_hash:
+            print(f"♻️ Content unchanged: {url}")
+            crawl_state.touch(url, etag, last_modified)
+            frontier.finish(url, DONE)
+            stats["unchanged"] += 1
+            return
+
+        chunks = text_splitter.split_documents([doc])
         
         # Filter out empty chunks
         valid_chunks = [chunk for chunk in chunks if chunk.page_content.strip()]
+
+        # Drop boilerplate chunks already stored for another page (ids keep their position so they stay stable)
+        keep = await asyncio.to_thread(deduplicator.filter, url, [chunk.page_content for chunk in valid_chunks])
+        if len(keep) < len(valid_chunks):
+            print(f"🧬 Skipping {len(valid_chunks) - len(keep)} duplicate chunks from {url}")
+            stats["duplicates"] += len(valid_chunks) - len(keep)
+        unique_chunks = [valid_chunks[index] for index in keep]
+        chunk_ids = [chunk_id(url, index) for index in keep]
+        for index, chunk in zip(keep, unique_chunks):
+            chunk.metadata["chunk_index"] = index  # lets the API merge neighbouring chunks back together
+        pending_pages[url] = (etag, last_modified, page_hash, chunk_ids, known)
         
-        if not valid_chunks:
-            print(f"No valid content chunks from {url}")
-            save_visited(url)
-            visited.add(url)
-            continue
-            
-        print(f"Adding {len(valid_chunks)} chunks to vectorstore...")
-        try:
-            vectorstore.add_documents(valid_chunks)
-            print(f"✅ Successfully added {len(valid_chunks)} chunks from {url}")
-        except Exception as e:
-            print(f"❌ Failed to add documents to vectorstore: {e}")
-            continue
+        if not unique_chunks:
+            print(f"No new content chunks from {url}")
+            await finish_page(url)
+            return
             
-        save_visited(url)
-        visited.add(url)
+        print(f"Queueing {len(unique_chunks)} chunks from {url} for embedding...")
+        pending_chunks[url] = len(unique_chunks)
+        for item_id, chunk in zip(chunk_ids, unique_chunks):
+            await chunk_queue.put((url, item_id, chunk))
 
-        if depth < max_depth:
+    active = 0
+    wakeup = asyncio.Event()
+
+    async def worker(client):
+        nonlocal active
+        while True:
+            while not frontier:
+                if active == 0:
+                    return
+                wakeup.clear()
+                await wakeup.wait()
+            url, depth = frontier.pop()
+            active += 1
             try:
-                res = requests.get(url)
-                links = extract_links(res.text, base_url=f"{res.url.split('//')[0]}//{res.url.split('/')[2]}")
-                for link in links:
-                    queue.append((link, depth + 1))
-            except:
-                pass
+                await process(client, url, depth)
+            except Exception as e:
+                # Chunks already queued still get stored, but the page is not marked done
+                print(f"❌ Failed to process {url}: {e}")
+                failed_pages.add(url)
+                pending_pages.pop(url, None)
+                frontier.finish(url, FAILED)
+            finally:
+                active -= 1
+                wakeup.set()
 
+    pipeline = [asyncio.create_task(batcher()), asyncio.create_task(writer())]
+    embedders = [asyncio.create_task(embedder()) for _ in range(EMBED_WORKERS)]
+    stages = pipeline + embedders
+
+    async def watched(*aws):
+        """Await ``aws``, failing as soon as a pipeline stage dies (its queue would otherwise block them forever)"""
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        waiting, pending = set(tasks), set(tasks) | set(stages)
+        try:
+            while waiting:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                waiting -= done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        async with httpx.AsyncClient(
+            headers={"User-Agent": os.environ["USER_AGENT"]},
+            follow_redirects=True,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=CRAWL_CONCURRENCY * 2),
+        ) as client:
+            await watched(*(worker(client) for _ in range(CRAWL_CONCURRENCY)))
+
+        # Drain the pipeline: flush the last partial batch, then stop each stage in order
+        await watched(chunk_queue.put(None))
+        await watched(*embedders)
+        await watched(write_queue.put(None))
+        await watched(*pipeline)
+
+        # rag_api's mmap backend picks the rebuilt index up on its next search.
+        # Only built when that backend is in use: configured here, or an index already exists
+        changed = stats["chunks"] or stats["changed"] or stats["removed"]
+        existing_dtype = index_dtype(VECTOR_INDEX_DIR)
+        dtype = VECTOR_INDEX_DTYPE or existing_dtype
+        if dtype and (changed or existing_dtype is None):
+            await asyncio.to_thread(build_index, vectorstore._collection, VECTOR_INDEX_DIR, dtype)
+    finally:
+        # After a failure, stop the stages still running before their stores are closed
+        for task in stages:
+            task.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        await close_clients()
+        crawl_state.close()
+        # Final checkpoint: pages still in progress are fetched again by the next run
+        frontier.close()
+        lexical_index.close()
+        cache_dependencies.close()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["pages_per_sec"] = round(stats["pages"] / elapsed, 2) if elapsed else 0.0
+    stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+    print(f"📊 Ingested {stats['pages']} pages / {stats['chunks']} chunks in {stats['batches']} batches "
+          f"({stats['pages_per_sec']} pages/s, {stats['chunks_per_sec']} chunks/s), "
+          f"{stats['duplicates']} duplicate chunks skipped")
+    if refresh:
+        print(f"♻️ {stats['unchanged']} unchanged, {stats['changed']} re-embedded, {stats['removed']} removed")
     print("✅ All done! Data stored in ChromaDB.")
+    return stats
+
+def crawl_and_store(seed_urls, max_depth=2, refresh=False):
+    return asyncio.run(acrawl_and_store(seed_urls, max_depth, refresh))
 
-# crawl_and_store(["https://enterprise.arcgis.com/en/portal/latest/administer/windows/configure-and-deploy-arcgis-enterprise-for-raster-analytics.htm"])
-crawl_and_store(["https://enterprise.arcgis.com/en/get-started/latest/windows/additional-server-deployment.htm"])
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl ArcGIS Enterprise documentation into ChromaDB")
+    parser.add_argument(
+        "seed_urls",
+        nargs="*",
+        # "https://enterprise.arcgis.com/en/portal/latest/administer/windows/configure-and-deploy-arcgis-enterprise-for-raster-analytics.htm"
+        default=["https://enterprise.arcgis.com/en/get-started/latest/windows/additional-server-deployment.htm"],
+    )
+    parser.add_argument("--max-depth", type=int, default=2)
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="re-check every known page with conditional requests and re-embed only pages that changed",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    crawl_and_store(args.seed_urls, args.max_depth, refresh=args.refresh)
@@ -0,0 +1,151 @@
+import re
+from typing import List, NamedTuple
+
+MAX_PARAGRAPH_CHARS = 600    # Longer unstructured paragraphs fail the quality gate
+SHORT_ANSWER_CHARS = 400     # Answers this short are acceptable as plain prose
+MAX_HEADING_CHARS = 60
+
+_BULLET = re.compile(r"^\s*(?:[•●▪◦*–—-]|o(?=\s))\s+(.*)$")
+_NUMBERED = re.compile(r"^\s*(?:step\s+)?(\d{1,2})\s*[.):]\s+(.*)$", re.I)
+_INLINE_STEPS = re.compile(r"(?:(?<=\s)|^)(?:step\s+)?(\d{1,2})[.)]\s+(?=[A-Z])", re.I)
+_SEQUENCE_WORDS = re.compile(r"^(first|second|third|next|then|after that|finally|lastly)\b[,:]?\s*", re.I)
+_FIRST_CLAUSE = re.compile(r"^(.*\S),\s+first\b[,:]?\s+(.+)$", re.I | re.S)  # "To add a server, first install X."
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+_CODE_TOKEN = re.compile(
+    r"(?<![`\w])("
+    r"[A-Za-z]:\\(?:[\w.$-]+(?: [\w.$-]+)*\\)*(?:[\w.$-]*[\w$-])?"  # Windows paths (folders may contain spaces)
+    r"|(?:~|\.{1,2})?/(?:[\w.-]+/)*[\w.-]*[\w-]/?"            # POSIX paths and URL paths
+    r"|[\w-]+\.(?:exe|bat|sh|ps1|py|json|xml|yml|yaml|properties|conf|config|txt|log|cfg|pem|pfx|crt)"
+    r"|--?[a-z][\w-]+"                                       # command-line flags
+    r")(?![`\w])"
+)
+_MARKDOWN = re.compile(r"^(#{1,6}\s|[-*]\s|\d+\.\s|```|>\s)", re.M)
+
+
+class FormatResult(NamedTuple):
+    markdown: str
+    acceptable: bool
+    reason: str
+
+
+def _wrap_code(line: str) -> str:
+    """Backtick file paths, file names and flags outside existing code spans and URLs"""
+    parts = re.split(r"(`[^`]*`|https?://\S+)", line)
+    for i in range(0, len(parts), 2):
+        wrapped = _CODE_TOKEN.sub(lambda match: f"`{match.group(1)}`" if len(match.group(1)) > 2 else match.group(1), parts[i])
+        parts[i] = re.sub(r"` `", " ", wrapped)  # "`tool.exe` `--flag`" -> "`tool.exe --flag`"
+    return "".join(parts)
+
+
+def _is_heading(line: str, next_line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > MAX_HEADING_CHARS or not next_line.strip():
+        return False
+    if stripped.endswith(":") and not _BULLET.match(stripped) and not _NUMBERED.match(stripped):
+        return len(stripped.split()) <= 8
+    return False
+
+
+def _split_inline_steps(paragraph: str) -> List[str]:
+    """"1. Install X. 2. Configure Y." written as one paragraph -> one step per item"""
+    matches = list(_INLINE_STEPS.finditer(paragraph))
+    if len(matches) < 2 or [int(m.group(1)) for m in matches] != list(range(int(matches[0].group(1)), int(matches[0].group(1)) + len(matches))):
+        return []
+    lead = paragraph[:matches[0].start()].strip()
+    items = []
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(paragraph)
+        items.append(paragraph[match.end():end].strip())
+    return ([lead] if lead else []) + [f"{number}. {item}" for number, item in enumerate(items, 1)]
+
+
+def _split_sequence(paragraph: str) -> List[str]:
+    """Sentences introduced by first/then/next/finally become numbered steps"""
+    sentences = _SENTENCE_END.split(paragraph)
+    flagged = [bool(_SEQUENCE_WORDS.match(sentence)) for sentence in sentences]
+    if not any(flagged):
+        return []
+    start = flagged.index(True)
+    lead = " ".join(sentences[:start]).strip()
+    # The first step may open mid-sentence: split the lead at its ", first" clause
+    if start and (clause := _FIRST_CLAUSE.match(sentences[start - 1])):
+        start -= 1
+        sentences[start] = clause.group(2)
+        flagged[start] = True
+        lead = " ".join(sentences[:start] + [clause.group(1) + ":"]).strip()
+    if sum(flagged) < 2:
+        return []
+    steps = []
+    for sentence, is_step in zip(sentences[start:], flagged[start:]):
+        if is_step or not steps:
+            body = _SEQUENCE_WORDS.sub("", sentence, count=1)
+            steps.append(body[:1].upper() + body[1:])
+        else:
+            steps[-1] += " " + sentence
+    return ([lead] if lead else []) + [f"{number}. {step}" for number, step in enumerate(steps, 1)]
+
+
+def _format_block(block: str) -> List[str]:
+    lines = block.split("\n")
+    if all(line.startswith(("    ", "\t")) for line in lines if line.strip()):
+        return ["```", *(line[4:] if line.startswith("    ") else line[1:] for line in lines), "```"]
+
+    out = []
+    previous = None  # Kind of the last line emitted under a heading
+    for index, line in enumerate(lines):
+        next_line = lines[index + 1] if index + 1 < len(lines) else ""
+        if bullet := _BULLET.match(line):
+            kind, formatted = "list", f"- {_wrap_code(bullet.group(1).strip())}"
+        elif numbered := _NUMBERED.match(line):
+            kind, formatted = "list", f"{numbered.group(1)}. {_wrap_code(numbered.group(2).strip())}"
+        elif _is_heading(line, next_line):
+            kind, formatted = "heading", f"### {line.strip().rstrip(':')}"
+        elif line.strip():
+            kind, formatted = "text", _wrap_code(line.strip())
+        else:
+            continue
+        # Lines under a heading stay separate: without a blank line markdown would run them into one paragraph
+        if previous not in (None, "heading") and "text" in (kind, previous):
+            out.append("")
+        if kind == "heading" or previous is not None:
+            previous = kind
+        out.append(formatted)
+    if len(out) == 1 and not _MARKDOWN.match(out[0]):
+        steps = _split_inline_steps(out[0]) or _split_sequence(out[0])
+        if steps:
+            return [steps[0], ""] + steps[1:] if not _MARKDOWN.match(steps[0]) else steps
+    return out
+
+
+def has_markdown(text: str) -> bool:
+    """Headings, list items, fences or quotes at line starts, or bold/inline code anywhere"""
+    return bool(_MARKDOWN.search(text)) or "**" in text or "`" in text
+
+
+def format_markdown(text: str) -> FormatResult:
+    """Rule-based markdown cleanup of a model answer: headings, lists, steps, code spans and blocks.
+
+    ``acceptable`` is the quality gate: False means the heuristics could not
+    give the answer usable structure and a model-based formatter should run.
+    """
+    text = text.replace("\r\n", "\n").strip()
+    if not text:
+        return FormatResult("", False, "empty")
+    if "```" in text:
+        # Already fenced code: leave the answer as the model wrote it
+        return FormatResult(text, True, "already formatted")
+
+    blocks = [block for block in re.split(r"\n\s*\n", text) if block.strip()]
+    formatted = []
+    for block in blocks:
+        formatted.append("\n".join(_format_block(block)))
+    markdown = "\n\n".join(formatted)
+
+    prose = [block for block in formatted if not _MARKDOWN.search(block)]
+    longest = max((len(block) for block in prose), default=0)
+    structured = bool(_MARKDOWN.search(markdown))
+    if longest > MAX_PARAGRAPH_CHARS:
+        return FormatResult(markdown, False, f"unstructured paragraph of {longest} chars")
+    if not structured and len(markdown) > SHORT_ANSWER_CHARS:
+        return FormatResult(markdown, False, "no lists, steps or headings found")
+    return FormatResult(markdown, True, "structured" if structured else "short answer")
@@ -1,19 +1,82 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-from langchain_chroma import Chroma
-from langchain.embeddings.base import Embeddings
-from langchain.schema import Document
-from typing import List
-import hashlib
+from langchain_core.documents import Document
+import asyncio
 import json
+import logging
+import os
+import time
+import numpy as np
 import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from collections import Counter
 from datetime import datetime
-import time
+from typing import Callable, List, Optional, Tuple
+
+from cache_invalidation import ANSWER, DOCS, CacheDependencies, content_version
+from chroma_store import open_store
+from context_packing import classify_question, pack_context
+from doc_cache import DocumentCache
+from embedding_cache import EmbeddingCache
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from lm_client import (
+    CHAT_COMPLETIONS_URL,
+    NomicEmbedding,
+    ThinkStreamParser,
+    close_clients,
+    make_lm_studio_request,
+    set_scheduler,
+    stream_lm_studio_request,
+)
+from lm_scheduler import LMStudioScheduler, SchedulerBusy
+from markdown_formatter import format_markdown, has_markdown
+from metrics import REGISTRY, record_stage, server_timing, timed, track_request
+from reranker import make_reranker
+from response_cache import CachedAnswer, SemanticResponseCache, question_id
+from single_flight import Flight, InFlightRegistry
+from text_utils import normalize_question
+from vector_index import open_index
+from warmup import WarmupTracker
 
-app = FastAPI()
+# Per-request detail is logged at DEBUG; set RAG_LOG_LEVEL=DEBUG to see every pipeline step
+LOG_LEVEL = os.environ.get("RAG_LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("rag_api")
+
+# Prometheus metrics, served at /metrics
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Latency of each query pipeline stage", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram("rag_request_seconds", "End-to-end query latency", ["endpoint", "outcome"])
+CACHE_LOOKUPS = REGISTRY.counter("rag_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "Tokens processed by LM Studio chat models", ["model", "kind"])
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "rag_context_tokens", "Estimated tokens of packed retrieval context", buckets=(128, 256, 512, 1024, 1536, 2048, 3072, 4096)
+)
+FORMATTER_RUNS = REGISTRY.counter("rag_formatter_total", "Answers needing formatting, by who formatted them", ["result"])
+RERANK_RUNS = REGISTRY.counter("rag_rerank_total", "Reranking passes, by whether every candidate was scored in budget", ["result"])
+BATCH_QUESTIONS = REGISTRY.counter("rag_batch_questions_total", "Questions answered through /query/batch, by how", ["result"])
+CACHE_INVALIDATIONS = REGISTRY.counter(
+    "rag_cache_invalidations_total", "Cache entries dropped because a chunk they were built from changed", ["cache"]
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve immediately; stores open and models warm up in the background (see /ready)
+    warmup_task = asyncio.create_task(warmup.run())
+    invalidation_task = asyncio.create_task(invalidation_loop())
+    yield
+    warmup_task.cancel()
+    invalidation_task.cancel()
+    # Persist pending hit counts for the next eviction decisions
+    if response_cache is not None:
+        await asyncio.to_thread(response_cache.evict)
+    # Release pooled LM Studio connections
+    await close_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -31,435 +94,1117 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def read_index():
     return FileResponse('static/index.html')
 
-def make_lm_studio_request(url: str, payload: dict, timeout: int = 120, max_retries: int = 2):
-    """Make request to LM Studio with retry logic and better timeout handling"""
-    for attempt in range(max_retries + 1):
-        try:
-            print(f"🔗 LM Studio request attempt {attempt + 1}/{max_retries + 1} (timeout: {timeout}s)")
-            response = requests.post(
-                url,
-                headers={"Content-Type": "application/json"},
-                json=payload,
-                timeout=timeout
-            )
-            if response.status_code == 200:
-                return response
-            else:
-                print(f"⚠️ LM Studio returned status {response.status_code}: {response.text}")
-                
-        except requests.exceptions.Timeout:
-            print(f"⏰ Timeout on attempt {attempt + 1} (waited {timeout}s)")
-            if attempt < max_retries:
-                wait_time = 2 ** attempt  # Exponential backoff
-                print(f"🔄 Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise Exception(f"LM Studio timeout after {max_retries + 1} attempts")
-                
-        except requests.exceptions.ConnectionError:
-            raise Exception("LM Studio server not responding - please check if it's running")
-        except Exception as e:
-            print(f"❌ LM Studio error on attempt {attempt + 1}: {str(e)}")
-            if attempt == max_retries:
-                raise
-
-class NomicEmbedding(Embeddings):
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        try:
-            payload = {"model": "text-embedding-nomic-embed-text-v1.5", "input": texts}
-            response = make_lm_studio_request(
-                "http://127.0.0.1:1234/v1/embeddings", 
-                payload, 
-                timeout=30  # Shorter timeout for embeddings
-            )
-            return [d["embedding"] for d in response.json()["data"]]
-        except Exception as e:
-            print(f"❌ Embedding failed: {str(e)}")
-            raise Exception(f"Failed to generate embeddings: {str(e)}")
-
-    def embed_query(self, text: str) -> List[float]:
-        return self.embed_documents([text])[0]
-
 embedding = NomicEmbedding()
-vectorstore = Chroma(persist_directory="./chroma_data", embedding_function=embedding)
 
-# Initialize semantic cache (separate Chroma instance)
-semantic_cache = Chroma(
-    persist_directory="./semantic_cache_data", 
-    embedding_function=embedding,
-    collection_name="rag_responses"
+# Initialize document cache (falls back to an in-process LRU while Redis is unreachable)
+# Short timeouts and no client-side retries: a dead Redis must cost a request milliseconds, not seconds
+redis_client = redis.Redis(
+    host='localhost', port=6379, db=0, decode_responses=True,
+    socket_timeout=0.5, socket_connect_timeout=0.5, retry_on_timeout=False, retry=Retry(NoBackoff(), 0)
 )
 
-# Initialize document cache
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-    redis_client.ping()  # Test connection
-    print("✅ Redis connected for document caching")
-except:
-    print("⚠️  Redis not available, document cache disabled")
-    redis_client = None
-
 # Configuration
-SEMANTIC_SIMILARITY_THRESHOLD = 0.7  # Much higher threshold - identical questions scoring 0.655!
+# Squared L2 between question embeddings (normalized: 2 - 2*cosine), so 0.15 is cosine ~0.925. Also used to
+# coalesce in-flight generations and group batch duplicates. Re-measure with `bench/run_benchmark.py thresholds`.
+SEMANTIC_SIMILARITY_THRESHOLD = 0.15
+# Misses closer than this (cosine ~0.875) get the cached answer as a provisional reply while a fresh one generates.
+# Kept below the closest same-topic-but-different question pairs (`bench/run_benchmark.py thresholds`). None = off
+NEAR_HIT_THRESHOLD = 0.25
 DOCUMENT_CACHE_TTL = 3600  # 1 hour
+DOCUMENT_CACHE_LOCAL_ENTRIES = 2048  # In-process fallback entries while Redis is down
+DOCUMENT_CACHE_BUCKET_BITS = None  # e.g. 24: also share results between questions in the same embedding bucket
 SEMANTIC_CACHE_TTL = 7 * 24 * 3600  # 7 days
+SEMANTIC_CACHE_MAX_ENTRIES = 5000  # Trimmed back to 90% when exceeded
+SEMANTIC_CACHE_EVICTION = "lru"  # "lru" (least recently hit) or "lfu" (least hit)
+EMBEDDING_CACHE_SIZE = 4096  # Question embeddings kept in memory
+EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite3"  # Set to None to keep the embedding cache in memory only
+DEEPSEEK_MODEL = "deepseek-r1-distill-qwen-7b"
+GRANITE_MODEL = "granite-3.1-8b-instruct:2"
+CONTEXT_TOKEN_BUDGET = 1500  # Estimated prompt tokens of retrieved context sent to DeepSeek
+# Generation caps per question class - DeepSeek's <think> reasoning counts against these too,
+# and R1 often reasons for 1000+ tokens before answering even short factual questions
+MAX_TOKENS_BY_CLASS = {
+    "factual": 2048,
+    "conceptual": 2560,
+    "general": 3072,
+    "procedural": 3584,
+    "troubleshooting": 3584,
+}
+RULE_FORMATTER_ENABLED = True  # Format answers with markdown_formatter before falling back to a Granite call
+LEXICAL_INDEX_PATH = "./lexical_index.sqlite3"  # BM25 index the crawler keeps in step with chroma_data
+VECTOR_CANDIDATES = 10  # Nearest chunks (distance < 1) considered for fusion
+LEXICAL_CANDIDATES = 10  # Top BM25 chunks considered for fusion
+RETRIEVAL_K = 6  # Chunks kept after reciprocal rank fusion (without a reranker)
+VECTOR_BACKEND = "chroma"  # "chroma" (HNSW) or "mmap" (int8/float16 matrix built by main.py or vector_index.py)
+VECTOR_INDEX_PATH = "./vector_index"
+RERANKER = "lexical"  # "lexical", "cross-encoder" (needs sentence-transformers) or None to disable
+RERANK_CANDIDATES = 10  # Fused chunks handed to the reranker
+RERANK_TOP_N = 4  # Chunks the reranker keeps for the prompt
+RERANK_BUDGET_SECONDS = 0.15  # Stop scoring new batches after this; unscored chunks keep fusion order
+RERANK_BATCH_SIZE = 8  # Chunks scored per cross-encoder call
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+LM_MAX_CONCURRENT = 2  # LM Studio calls in flight at once (embeddings and generations)
+LM_MAX_GENERATIONS = 1  # Chat completions at once - LM Studio serves one generation at a time
+LM_MAX_QUEUED_GENERATIONS = 4  # Generations allowed to wait; more are answered 503 with Retry-After
+WARMUP_ENABLED = True  # At startup: load indexes, embed once, 1-token completion per model, warm hot cache entries
+WARMUP_MODEL_TIMEOUT = 180  # Seconds for LM Studio to load a model on its first request
+WARMUP_HOT_ENTRIES = 200  # Most hit cached questions whose embeddings are preloaded
+CACHE_DEPS_PATH = "./cache_deps.sqlite3"  # Chunk versions published by main.py + what each cache entry was built from
+CACHE_INVALIDATION_POLL_SECONDS = 5  # How often to drop cache entries whose chunks the crawler changed
+BATCH_MAX_QUESTIONS = 1000  # Questions accepted per /query/batch request
+BATCH_EMBED_SIZE = 128  # Questions per embedding request
+BATCH_WORKERS = 2  # Batch generations at once - below LM_MAX_QUEUED_GENERATIONS so live queries still get a slot
+BATCH_CACHE_WRITE_SIZE = 16  # Generated answers per bulk semantic cache write
+BATCH_BUSY_TIMEOUT = 1800  # Seconds a batch question keeps waiting out a full LM Studio queue before it is reported busy
+BATCH_BUSY_MAX_SLEEP = 30  # Longest pause between attempts (the scheduler's Retry-After estimate, capped)
 
-@app.post("/query")
-async def query_rag(request: Request):
-    body = await request.json()
-    question = body.get("question")
-    print(f"Received question: {question}")
-    print(f"\n🔍 Processing query: '{question}'")
-    print(f"📊 Cache threshold: {SEMANTIC_SIMILARITY_THRESHOLD}")
-    
-    # === SEMANTIC CACHE CHECK ===
-    print("🧠 Checking semantic cache...")
+doc_cache = DocumentCache(
+    redis_client,
+    ttl_seconds=DOCUMENT_CACHE_TTL,
+    max_local_entries=DOCUMENT_CACHE_LOCAL_ENTRIES,
+    bucket_bits=DOCUMENT_CACHE_BUCKET_BITS
+)
+
+# Opened by open_stores() on first use or during warm-up - importing this module stays cheap
+vectorstore = None
+semantic_cache = None
+response_cache: Optional[SemanticResponseCache] = None
+embedding_cache: Optional[EmbeddingCache] = None
+lexical_index: Optional[BM25Index] = None
+vector_index = None
+reranker = None
+dependencies: Optional[CacheDependencies] = None
+_stores_task: Optional[asyncio.Task] = None
+_invalidated_seq = 0  # Chunk changes up to here have been applied to the caches
+
+def open_stores() -> dict:
+    """Open the vector stores, caches and indexes (blocking - runs once, in a worker thread)"""
+    global vectorstore, semantic_cache, response_cache, embedding_cache, lexical_index, vector_index, reranker, dependencies
+    # Embedded on disk per process, or shared by every worker through a Chroma server (CHROMA_SERVER_URL)
+    vectorstore = open_store("./chroma_data", embedding)
+    # Initialize semantic cache (separate Chroma instance)
+    semantic_cache = open_store("./semantic_cache_data", embedding, collection_name="rag_responses")
+    dependencies = CacheDependencies(CACHE_DEPS_PATH)
+    response_cache = SemanticResponseCache(
+        semantic_cache,
+        ttl_seconds=SEMANTIC_CACHE_TTL,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        eviction_policy=SEMANTIC_CACHE_EVICTION,
+        on_evict=lambda entry_ids: dependencies.forget([(ANSWER, entry_id) for entry_id in entry_ids])
+    )
+    # Drop answers that expired while the server was down, and entries indexed by their answer's embedding
+    response_cache.evict()
+    response_cache.drop_legacy()
+    embedding_cache = EmbeddingCache(max_entries=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH)
+    lexical_index = BM25Index(LEXICAL_INDEX_PATH)
+    vector_index = open_index(VECTOR_INDEX_PATH) if VECTOR_BACKEND == "mmap" else None
+    if VECTOR_BACKEND == "mmap" and vector_index is None:
+        logger.warning("⚠️  No vector index at %s - run `python vector_index.py`; searching Chroma instead", VECTOR_INDEX_PATH)
+    reranker = make_reranker(RERANKER, RERANK_TOP_N, RERANK_BUDGET_SECONDS, RERANK_BATCH_SIZE, CROSS_ENCODER_MODEL)
+
+    indexed, stored = len(lexical_index), vectorstore._collection.count()
+    if stored and not indexed:
+        logger.warning("⚠️  Lexical index is empty - run `python lexical_index.py` to build it; using vector search only")
+    elif indexed != stored:
+        logger.warning("⚠️  Lexical index holds %d chunks but chroma_data has %d - run `python lexical_index.py` to sync", indexed, stored)
+    return {"chunks": stored, "lexical_chunks": indexed, "cached_answers": response_cache.count()}
+
+async def ensure_stores():
+    """Wait for open_stores(), starting it if nothing has yet (a failed attempt is retried)"""
+    global _stores_task
+    if _stores_task is None or (_stores_task.done() and _stores_task.exception() is not None):
+        _stores_task = asyncio.create_task(asyncio.to_thread(open_stores))
+    return await asyncio.shield(_stores_task)
+
+# Admission control for LM Studio: embeddings jump the queue, overload fails fast with an estimated wait
+lm_scheduler = LMStudioScheduler(
+    max_concurrent=LM_MAX_CONCURRENT,
+    max_generations=LM_MAX_GENERATIONS,
+    max_queue=LM_MAX_QUEUED_GENERATIONS
+)
+set_scheduler(lm_scheduler)
+
+# Generations currently running, so concurrent identical questions share one LLM call
+inflight_generations = InFlightRegistry(similarity_threshold=SEMANTIC_SIMILARITY_THRESHOLD)
+
+async def embed_question(question: str) -> List[float]:
+    """Embed the question once per request, reusing vectors for repeated questions"""
+    cached_vector = embedding_cache.get(question)
+    if cached_vector is not None:
+        CACHE_LOOKUPS.inc(cache="embedding", result="hit")
+        logger.debug("🧮 Embedding cache HIT")
+        return cached_vector
+    CACHE_LOOKUPS.inc(cache="embedding", result="miss")
+    with timed(STAGE_SECONDS, "embed"):
+        vector = await embedding.aembed_query(question)
+    await asyncio.to_thread(embedding_cache.put, question, vector)
+    return vector
+
+def cached_hit_response(answer: CachedAnswer, cache_type: str) -> dict:
+    response_cache.record_hit(answer.entry_id)
+    cached_response = dict(answer.response)
+    cached_response["cache_hit"] = True
+    cached_response["cache_type"] = cache_type
+    cached_response["similarity_score"] = answer.distance
+    cached_response["cached_question"] = answer.question
+    return cached_response
+
+async def lookup_exact_cache(question: str) -> Optional[dict]:
+    """Hash lookup on the normalized question - runs before any embedding work"""
     try:
-        cache_results = semantic_cache.similarity_search_with_score(question, k=3)  # Get top 3 for debugging
-        print(f"📦 Found {len(cache_results)} cached items")
-        
-        if cache_results:
-            for i, (doc, score) in enumerate(cache_results):
-                cached_question = doc.metadata.get('question', 'N/A')
-                print(f"   #{i+1}: Score {score:.3f} - Question: {cached_question[:50]}...")
-                
-                # Debug: Check if this is an exact match
-                if cached_question.lower().strip() == question.lower().strip():
-                    print(f"   🎯 EXACT TEXT MATCH found but similarity score is {score:.3f} (should be ~0.0)")
-                    print(f"   💡 This suggests embeddings/ChromaDB issue - forcing cache hit!")
-                    
-                    # Force cache hit for exact text matches regardless of similarity score
-                    try:
-                        cached_response = json.loads(doc.page_content)
-                        cached_response["cache_hit"] = True
-                        cached_response["cache_type"] = "exact_match"
-                        cached_response["similarity_score"] = score
-                        cached_response["cached_question"] = cached_question
-                        
-                        print(f"🚀 FORCED cache hit for exact match!")
-                        return cached_response
-                    except json.JSONDecodeError as json_error:
-                        print(f"❌ Failed to parse exact match cached response: {json_error}")
-            
-            # Check best match
-            best_doc, best_score = cache_results[0]
-            print(f"🎯 Best match score: {best_score:.3f} (threshold: {SEMANTIC_SIMILARITY_THRESHOLD})")
-            print(f"🔍 Similarity check: {best_score:.3f} < {SEMANTIC_SIMILARITY_THRESHOLD} = {best_score < SEMANTIC_SIMILARITY_THRESHOLD}")
-            
-            if best_score < SEMANTIC_SIMILARITY_THRESHOLD:
-                print(f"✅ SEMANTIC CACHE HIT! Using cached response (similarity: {best_score:.3f})")
-                print(f"🚀 Cache hit means NO LLM processing needed - instant response!")
-                
-                # Parse cached response
-                try:
-                    cached_response = json.loads(best_doc.page_content)
-                    cached_response["cache_hit"] = True
-                    cached_response["cache_type"] = "semantic"
-                    cached_response["similarity_score"] = best_score
-                    cached_response["cached_question"] = best_doc.metadata.get('question', '')
-                    
-                    print(f"🚀 Returning cached response in ~50ms instead of 10+ seconds!")
-                    return cached_response
-                except json.JSONDecodeError as json_error:
-                    print(f"❌ Failed to parse cached response JSON: {json_error}")
-            else:
-                print(f"❌ No cache hit - best score {best_score:.3f} > threshold {SEMANTIC_SIMILARITY_THRESHOLD}")
-                print(f"💡 Identical questions should score ~0.0, not {best_score:.3f}")
-                print(f"💡 Consider increasing threshold or checking embedding consistency")
-        else:
-            print("📭 No cached items found - this is a new question")
-            
+        with timed(STAGE_SECONDS, "exact_cache"):
+            answer = await asyncio.to_thread(response_cache.get_exact, question)
     except Exception as e:
-        print(f"⚠️ Semantic cache error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.warning("⚠️ Exact-match cache error: %s", e)
+        return None
+    if answer is None:
+        CACHE_LOOKUPS.inc(cache="exact", result="miss")
+        return None
+    CACHE_LOOKUPS.inc(cache="exact", result="hit")
+    logger.debug("🎯 EXACT MATCH cache hit for: '%s'", answer.question[:50])
+    return cached_hit_response(answer, "exact_match")
+
+def match_cached_answer(question: str, cache_results: List[CachedAnswer]) -> Optional[dict]:
+    """The cached response to serve from the nearest cached questions, or None on a miss"""
+    logger.debug("📦 Found %d cached items", len(cache_results))
+    if not cache_results:
+        logger.debug("📭 No cached items found - this is a new question")
+        return None
+
+    for i, answer in enumerate(cache_results):
+        logger.debug("   #%d: Score %.3f - Question: %s...", i + 1, answer.distance, answer.question[:50])
+        
+        # Entries cached before question-keyed ids only match exactly through here
+        if normalize_question(answer.question) == normalize_question(question):
+            logger.debug("🚀 Exact text match among similar questions (score %.3f)", answer.distance)
+            return cached_hit_response(answer, "exact_match")
     
-    print("🔄 Cache miss - proceeding with full RAG pipeline...")
+    # Check best match
+    best = cache_results[0]
+    logger.debug("🎯 Best match score: %.3f (threshold: %s)", best.distance, SEMANTIC_SIMILARITY_THRESHOLD)
     
+    if best.distance < SEMANTIC_SIMILARITY_THRESHOLD:
+        logger.debug("✅ SEMANTIC CACHE HIT! Using cached response (similarity: %.3f)", best.distance)
+        return cached_hit_response(best, "semantic")
+    logger.debug("❌ No cache hit - best score %.3f > threshold %s", best.distance, SEMANTIC_SIMILARITY_THRESHOLD)
+    return None
+
+async def lookup_semantic_cache(question: str, question_embedding: List[float]) -> Tuple[Optional[dict], Optional[CachedAnswer]]:
+    """(cached response, None) on a hit; on a miss (None, near match) - the near match is the
+    closest cached answer within NEAR_HIT_THRESHOLD, or None"""
+    logger.debug("🧠 Checking semantic cache...")
+    try:
+        with timed(STAGE_SECONDS, "semantic_cache"):
+            cache_results = await asyncio.to_thread(response_cache.search, question_embedding, 3)  # Get top 3 for debugging
+        cached_response = match_cached_answer(question, cache_results)
+        if cached_response is not None:
+            CACHE_LOOKUPS.inc(cache="semantic", result="hit")
+            return cached_response, None
+        if NEAR_HIT_THRESHOLD and cache_results and cache_results[0].distance < NEAR_HIT_THRESHOLD:
+            logger.debug("🌗 Near hit (score %.3f < %s) - serving it provisionally", cache_results[0].distance, NEAR_HIT_THRESHOLD)
+            CACHE_LOOKUPS.inc(cache="semantic", result="near_hit")
+            return None, cache_results[0]
+    except Exception:
+        logger.exception("⚠️ Semantic cache error")
+    
+    CACHE_LOOKUPS.inc(cache="semantic", result="miss")
+    return None, None
+
+def provisional_response(answer: CachedAnswer, refreshing: bool) -> dict:
+    """A near-hit answer, marked provisional; ``refreshing`` says whether a fresh answer is being generated"""
+    return {**cached_hit_response(answer, "near_hit"), "provisional": True, "refreshing": refreshing}
+
+def mmap_search(question_embedding: List[float]) -> list:
+    """Nearest chunks from the memory-mapped index, as (Document, squared L2 distance) like Chroma returns"""
+    vector_index.reload_if_changed()
+    hits = vector_index.search(question_embedding, VECTOR_CANDIDATES)
+    chunks = vector_index.get([chunk_id for chunk_id, _ in hits])
+    return [
+        (Document(page_content=chunks[chunk_id][0], metadata=chunks[chunk_id][1], id=chunk_id), distance)
+        for chunk_id, distance in hits
+    ]
+
+async def vector_search(question_embedding: List[float]) -> list:
+    with timed(STAGE_SECONDS, "vector_search"):
+        if vector_index is not None:
+            results = await asyncio.to_thread(mmap_search, question_embedding)
+        else:
+            results = await asyncio.to_thread(
+                vectorstore.similarity_search_by_vector_with_relevance_scores, question_embedding, k=VECTOR_CANDIDATES
+            )
+    return [doc for doc, score in results if score < 1]
+
+def vector_search_many_sync(question_embeddings: List[List[float]]) -> List[list]:
+    """vector_search for a whole batch: one matrix product (mmap) or one Chroma query"""
+    if vector_index is not None:
+        vector_index.reload_if_changed()
+        batches = vector_index.search_many(question_embeddings, VECTOR_CANDIDATES)
+        chunks = vector_index.get([chunk_id for hits in batches for chunk_id, _ in hits])
+        return [
+            [Document(page_content=chunks[chunk_id][0], metadata=chunks[chunk_id][1], id=chunk_id) for chunk_id, distance in hits if distance < 1]
+            for hits in batches
+        ]
+    result = vectorstore._collection.query(
+        query_embeddings=question_embeddings,
+        n_results=VECTOR_CANDIDATES,
+        include=["documents", "metadatas", "distances"],
+    )
+    return [
+        [
+            Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+            for chunk_id, text, metadata, distance in zip(ids, documents, metadatas, distances)
+            if distance < 1
+        ]
+        for ids, documents, metadatas, distances in zip(result["ids"], result["documents"], result["metadatas"], result["distances"])
+    ]
+
+async def lexical_search(question: str) -> List[str]:
+    """Chunk ids ranked by BM25 - empty (vector-only retrieval) if the index is missing or fails"""
+    try:
+        with timed(STAGE_SECONDS, "lexical_search"):
+            hits = await asyncio.to_thread(lexical_index.search, question, LEXICAL_CANDIDATES)
+    except Exception as e:
+        logger.warning("⚠️ Lexical search error: %s", e)
+        return []
+    return [chunk_id for chunk_id, _ in hits]
+
+async def fetch_chunks(chunk_ids: List[str]) -> dict:
+    """Stored chunks by id (ids no longer in chroma_data are left out)"""
+    docs = {}
+    if vector_index is not None:
+        docs = {
+            chunk_id: Document(page_content=text, metadata=metadata, id=chunk_id)
+            for chunk_id, (text, metadata) in vector_index.get(chunk_ids).items()
+        }
+        chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in docs]
+        if not chunk_ids:
+            return docs
+    stored = await asyncio.to_thread(vectorstore._collection.get, ids=chunk_ids, include=["documents", "metadatas"])
+    for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+        docs[chunk_id] = Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+    return docs
+
+async def hybrid_search(question: str, question_embedding: List[float], k: int, vector_docs: Optional[list] = None) -> list:
+    """Vector and BM25 candidates fused by reciprocal rank, best k first (vector_docs: already searched)"""
+    if vector_docs is None:
+        vector_docs, lexical_ids = await asyncio.gather(vector_search(question_embedding), lexical_search(question))
+    else:
+        lexical_ids = await lexical_search(question)
+    docs_by_id = {doc.id: doc for doc in vector_docs}
+    fused = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([list(docs_by_id), lexical_ids])[:k]]
+
+    # Chunks only the lexical index found still need their text and metadata
+    missing = [chunk_id for chunk_id in fused if chunk_id not in docs_by_id]
+    if missing:
+        docs_by_id.update(await fetch_chunks(missing))
+    logger.debug(
+        "🔀 Fused %d vector + %d lexical candidates into %d chunks (%d found only lexically)",
+        len(vector_docs), len(lexical_ids), len(fused), len(missing)
+    )
+    return [docs_by_id[chunk_id] for chunk_id in fused if chunk_id in docs_by_id]
+
+async def rerank_documents(question: str, docs: list) -> list:
+    """Keep the RERANK_TOP_N chunks the reranker scores highest (fusion order if it fails)"""
+    try:
+        with timed(STAGE_SECONDS, "rerank"):
+            result = await asyncio.to_thread(reranker.rerank, question, docs)
+    except Exception as e:
+        logger.warning("⚠️ Reranking error: %s", e)
+        return docs[:RERANK_TOP_N]
+    RERANK_RUNS.inc(result="over_budget" if result.over_budget else "complete")
+    logger.debug("🎯 Reranked %d of %d chunks with %s, kept %d", result.scored, len(docs), reranker.scorer.name, len(result.docs))
+    return result.docs
+
+def chunk_versions(docs: list) -> List[Tuple[str, str]]:
+    """(chunk id, content hash) of the chunks a cache entry is built from"""
+    return [(doc.id, content_version(doc.page_content)) for doc in docs if doc.id]
+
+def cache_document_ids(question: str, question_embedding: List[float], docs: list) -> bool:
+    """Cache a retrieval result with the chunk versions it depends on (not if they changed meanwhile)"""
+    doc_cache.put(question, question_embedding, [doc.id for doc in docs])
+    if dependencies.record(DOCS, doc_cache.keys(question, question_embedding), chunk_versions(docs)):
+        return True
+    doc_cache.delete(question, question_embedding)
+    return False
+
+async def retrieve_documents(question: str, question_embedding: List[float], vector_docs: Optional[list] = None) -> list:
+    """Relevant documentation chunks for the question, from the document cache or a hybrid search"""
     # === DOCUMENT CACHE CHECK ===
-    doc_cache_key = f"docs:{hashlib.md5(question.encode()).hexdigest()}"
-    relevant_docs = None
+    # Cached entries hold chunk ids only; the chunks themselves are read back from Chroma
+    try:
+        with timed(STAGE_SECONDS, "doc_cache"):
+            cached_ids = await asyncio.to_thread(doc_cache.get, question, question_embedding)
+            cached_docs = await fetch_chunks(cached_ids) if cached_ids else {}
+        if cached_ids and len(cached_docs) == len(cached_ids):
+            CACHE_LOOKUPS.inc(cache="document", result="hit")
+            logger.debug("📄 Document cache HIT (%d chunks)", len(cached_ids))
+            return [cached_docs[chunk_id] for chunk_id in cached_ids]
+        if cached_ids:
+            # A re-crawl replaced some of these chunks - search again
+            logger.debug("📄 Document cache entry is stale (%d of %d chunks left)", len(cached_docs), len(cached_ids))
+            await asyncio.to_thread(doc_cache.delete, question, question_embedding)
+    except Exception as e:
+        logger.warning("⚠️ Document cache error: %s", e)
+    CACHE_LOOKUPS.inc(cache="document", result="miss")
+    logger.debug("📄 Document cache MISS")
     
-    print(f"📄 Checking document cache with key: {doc_cache_key[:20]}...")
-    if redis_client:
+    # === HYBRID SEARCH (if no document cache hit) ===
+    logger.debug("🔍 Performing vector + lexical search...")
+    if reranker is not None:
+        relevant_docs = await rerank_documents(question, await hybrid_search(question, question_embedding, RERANK_CANDIDATES, vector_docs))
+    else:
+        relevant_docs = await hybrid_search(question, question_embedding, RETRIEVAL_K, vector_docs)
+    
+    # Cache the chunk ids
+    if relevant_docs and all(doc.id for doc in relevant_docs):
         try:
-            cached_docs_json = redis_client.get(doc_cache_key)
-            if cached_docs_json:
-                print("📄 Document cache HIT!")
-                cached_docs_data = json.loads(cached_docs_json)
-                relevant_docs = [
-                    type('Document', (), {
-                        'page_content': doc['content'],
-                        'metadata': doc['metadata']
-                    })() 
-                    for doc in cached_docs_data
-                ]
-                print(f"📄 Loaded {len(relevant_docs)} cached documents")
-            else:
-                print("📄 Document cache MISS")
+            if await asyncio.to_thread(cache_document_ids, question, question_embedding, relevant_docs):
+                logger.debug("📄 Cached %d chunk ids", len(relevant_docs))
         except Exception as e:
-            print(f"⚠️ Document cache error: {e}")
-    else:
-        print("📄 Redis not available - document cache disabled")
+            logger.warning("⚠️ Document cache save error: %s", e)
     
-    # === FULL VECTOR SEARCH (if no document cache hit) ===
-    if relevant_docs is None:
-        print("🔍 Performing full vector search...")
-        results = vectorstore.similarity_search_with_score(question, k=10)
-        relevant_docs = [doc for doc, score in results if score < 1]
+    return relevant_docs
+
+def no_documents_response() -> dict:
+    return {
+        "answer": "I couldn't find relevant information in the ArcGIS Enterprise documentation.",
+        "reasoning": "No relevant documents found in the knowledge base.",
+        "raw_response": "",
+        "used_granite": False,
+        "cache_hit": False
+    }
+
+def deepseek_payload(question: str, context: str, stream: bool = False, max_tokens: int = -1) -> dict:
+    return {
+        "model": DEEPSEEK_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are an ArcGIS Enterprise expert. Think through the problem step by step and provide a detailed technical answer based on the context."},
+            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
+        ],
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+
+def granite_payload(final_answer: str, stream: bool = False) -> dict:
+    return {
+        "model": GRANITE_MODEL,
+        "messages": [
+            {
+                "role": "system", 
+                "content": "You are a technical documentation specialist. Take the provided response and create a clean, well-formatted markdown summary. Use headings, bullet points, code blocks, and clear structure. Be concise but comprehensive."
+            },
+            {
+                "role": "user", 
+                "content": f"Please format this ArcGIS Enterprise response into clean markdown:\n\n{final_answer}"
+            }
+        ],
+        "temperature": 0.3,
+        "max_tokens": 1024,
+        "stream": stream
+    }
+
+def split_reasoning(raw_answer: str):
+    """Split DeepSeek output into (reasoning, final_answer, needs_formatting)"""
+    reasoning = ""
+    final_answer = raw_answer
+    needs_formatting = False
+    
+    # Look for thinking tags in the response
+    if "<think>" in raw_answer and "</think>" not in raw_answer:
+        # Cut off while reasoning: there is no answer, and the reasoning must not be shown as one
+        logger.debug("Unclosed <think> tag - the response ended inside the reasoning")
+        reasoning = raw_answer[raw_answer.find("<think>")+7:].strip()
+        final_answer = ""
+    elif "<think>" in raw_answer and "</think>" in raw_answer:
+        logger.debug("Found <think> tags - extracting reasoning...")
+        think_start = raw_answer.find("<think>")
+        think_end = raw_answer.find("</think>")
+        reasoning = raw_answer[think_start+7:think_end].strip()
+        final_answer = raw_answer[think_end+8:].strip()
+        logger.debug("Extracted reasoning (%d chars) and answer (%d chars)", len(reasoning), len(final_answer))
         
-        # Cache the documents
-        if redis_client and relevant_docs:
-            try:
-                docs_to_cache = [
-                    {
-                        'content': doc.page_content,
-                        'metadata': doc.metadata
-                    }
-                    for doc in relevant_docs
-                ]
-                redis_client.setex(
-                    doc_cache_key, 
-                    DOCUMENT_CACHE_TTL, 
-                    json.dumps(docs_to_cache)
-                )
-                print(f"📄 Cached {len(relevant_docs)} documents")
-            except Exception as e:
-                print(f"⚠️ Document cache save error: {e}")
+        # Check if final answer is well-formatted (a hyphenated word is not a list)
+        if not has_markdown(final_answer):
+            logger.debug("Final answer lacks formatting - will format it")
+            needs_formatting = True
+    else:
+        logger.debug("No <think> tags found - will format the whole response")
+        needs_formatting = True
     
-    if not relevant_docs:
+    return reasoning, final_answer, needs_formatting
+
+def truncated_response(reasoning: str, raw_answer: str) -> dict:
+    """Body for a generation that hit max_tokens before DeepSeek finished reasoning (never cached)"""
+    return {
+        "answer": "⚠️ The model ran out of room while reasoning, so it did not produce an answer. "
+                  "Please try again, or ask a narrower question.",
+        "reasoning": reasoning or None,
+        "raw_response": raw_answer,
+        "used_granite": False,
+        "truncated": True,
+        "cache_hit": False
+    }
+
+def cache_entry(question: str, question_embedding: List[float], response: dict, docs: list) -> tuple:
+    """(question, embedding, response, metadata) as response_cache.put_many stores it"""
+    versions = chunk_versions(docs)
+    metadata = {
+        "timestamp": datetime.now().isoformat(),
+        "doc_count": len(docs),
+        "response_type": "granite" if response["used_granite"] else "deepseek",
+        # Chroma metadata values are scalars, so the dependencies are stored as JSON
+        "chunk_ids": json.dumps([chunk_id for chunk_id, _ in versions]),
+        "chunk_hashes": json.dumps([content_hash for _, content_hash in versions]),
+        "sources": json.dumps(sorted({doc.metadata.get("source", "") for doc in docs} - {""}))
+    }
+    return question, question_embedding, {**response, "cached_at": datetime.now().isoformat()}, metadata
+
+def store_answers(entries: List[tuple]) -> int:
+    """Write answers and their chunk dependencies; answers whose chunks changed meanwhile are dropped again"""
+    response_cache.put_many(entries)
+    stale = []
+    for question, _, _, metadata in entries:
+        versions = list(zip(json.loads(metadata["chunk_ids"]), json.loads(metadata["chunk_hashes"])))
+        if not dependencies.record(ANSWER, [question_id(question)], versions):
+            stale.append(question_id(question))
+    response_cache.delete(stale)
+    return len(entries) - len(stale)
+
+async def cache_responses(entries: List[tuple]):
+    """Store generated responses in the semantic cache in one write (failures are logged, never raised)"""
+    logger.debug("💾 Caching %d response(s)...", len(entries))
+    try:
+        with timed(STAGE_SECONDS, "cache_write"):
+            stored = await asyncio.to_thread(store_answers, entries)
+        logger.debug("✅ Successfully cached %d response(s) for: '%s...'", stored, entries[0][0][:50])
+    except Exception:
+        logger.exception("❌ Failed to cache %d response(s)", len(entries))
+
+def apply_invalidations() -> int:
+    """Drop cached answers and document-cache entries built from chunks main.py has since changed or deleted"""
+    global _invalidated_seq
+    stale, _invalidated_seq = dependencies.stale_since(_invalidated_seq)
+    answers = [key for kind, key in stale if kind == ANSWER]
+    doc_keys = [key for kind, key in stale if kind == DOCS]
+    response_cache.delete(answers)
+    doc_cache.delete_keys(doc_keys)
+    dependencies.forget(stale)
+    if stale:
+        CACHE_INVALIDATIONS.inc(len(answers), cache="semantic")
+        CACHE_INVALIDATIONS.inc(len(doc_keys), cache="document")
+        logger.info("🔁 Invalidated %d cached answers and %d document cache keys built from changed chunks", len(answers), len(doc_keys))
+    # Document cache keys expire (or leave the local LRU) without telling anyone - age their dependencies out too
+    dependencies.expire(DOCS, DOCUMENT_CACHE_TTL)
+    return len(stale)
+
+async def invalidation_loop():
+    """Apply chunk changes published by the crawler, every CACHE_INVALIDATION_POLL_SECONDS"""
+    while True:
+        try:
+            await ensure_stores()
+            await asyncio.to_thread(apply_invalidations)
+        except Exception as e:
+            logger.warning("⚠️ Cache invalidation error: %s", e)
+        await asyncio.sleep(CACHE_INVALIDATION_POLL_SECONDS)
+
+def record_tokens(model: str, usage: dict, deltas: int):
+    """Count tokens from the reported usage, or one per streamed delta if the server sent none"""
+    if usage.get("prompt_tokens"):
+        LLM_TOKENS.inc(usage["prompt_tokens"], model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens", deltas), model=model, kind="completion")
+
+def error_response(e: Exception) -> dict:
+    """User-friendly error payload for LM Studio failures"""
+    error_msg = str(e)
+    if isinstance(e, SchedulerBusy):
         return {
-            "answer": "I couldn't find relevant information in the ArcGIS Enterprise documentation.",
-            "reasoning": "No relevant documents found in the knowledge base.",
-            "raw_response": "",
-            "used_granite": False,
-            "cache_hit": False
+            "error": f"🚦 The AI model is busy with other questions. Please try again in about {e.retry_after} seconds.",
+            "busy": True,
+            "retry_after": e.retry_after,
+            "technical_error": error_msg
         }
+    logger.exception("❌ Error in query_rag: %s", error_msg)
+    
+    # Provide user-friendly error messages
+    if "timeout" in error_msg.lower():
+        return {
+            "error": "⏰ The AI model is taking longer than expected to respond. This can happen with complex questions. Please try:\n\n" +
+                    "• **Simplify your question** - Break complex queries into smaller parts\n" +
+                    "• **Check LM Studio** - Ensure models are loaded and GPU/RAM is sufficient\n" +
+                    "• **Try again** - The system will retry automatically\n" +
+                    "• **Restart LM Studio** if issues persist\n\n" +
+                    "The system supports up to 3-minute processing for complex reasoning.",
+            "timeout": True,
+            "technical_error": error_msg
+        }
+    elif "connection" in error_msg.lower() or "not responding" in error_msg.lower():
+        return {
+            "error": "🔗 Cannot connect to LM Studio. Please ensure:\n\n" +
+                    "• **LM Studio is running** on port 1234\n" +
+                    "• **Models are loaded** (DeepSeek-R1, Granite, Nomic)\n" +
+                    "• **Local server is started** in LM Studio\n" +
+                    "• **No firewall blocking** localhost connections",
+            "connection_error": True,
+            "technical_error": error_msg
+        }
+    else:
+        return {
+            "error": f"Server error: {error_msg}",
+            "technical_error": error_msg
+        }
+
+async def generate_response(
+    question: str,
+    question_embedding: List[float],
+    publish: Callable[[str, dict], None],
+    vector_docs: Optional[list] = None,
+    cache_writes: Optional[List[tuple]] = None
+) -> dict:
+    """Retrieval + DeepSeek (+ Granite) for a cache miss.
+
+    Tokens are relayed through publish(event, data) as they arrive so streaming
+    subscribers can render them; the return value is the /query response body.
+    Batches pass the vector hits they already searched, and a cache_writes list
+    that collects the cache entry for one bulk write instead of writing it here.
+    """
+    relevant_docs = await retrieve_documents(question, question_embedding, vector_docs)
+    if not relevant_docs:
+        return no_documents_response()
     
     # === LLM PROCESSING ===
-    context = "\n\n".join([doc.page_content for doc in relevant_docs])
+    # Merge neighbouring chunks, most relevant first, within a fixed prompt budget
+    packed = pack_context(relevant_docs, CONTEXT_TOKEN_BUDGET)
+    question_class = classify_question(question)
+    CONTEXT_TOKENS.observe(packed.tokens)
+    logger.debug(
+        "📦 Packed %d chunks into %d blocks (~%d tokens, %d dropped); %s question, max_tokens %d",
+        len(relevant_docs), packed.blocks, packed.tokens, packed.dropped, question_class, MAX_TOKENS_BY_CLASS[question_class]
+    )
     
     try:
-        print(f"Received question: {question}")
+        # Step 1: relay DeepSeek tokens, splitting <think> reasoning from the answer as they arrive
+        logger.debug("Step 1: Sending request to DeepSeek-R1...")
+        parser = ThinkStreamParser()
+        usage, deltas = {}, 0
+        started = time.perf_counter()
+        with timed(STAGE_SECONDS, "deepseek"):
+            async for delta in stream_lm_studio_request(
+                CHAT_COMPLETIONS_URL,
+                deepseek_payload(question, packed.text, stream=True, max_tokens=MAX_TOKENS_BY_CLASS[question_class]),
+                timeout=180,  # 3 minutes for complex reasoning
+                usage=usage
+            ):
+                if not deltas:
+                    record_stage(STAGE_SECONDS, "deepseek_first_token", time.perf_counter() - started)
+                deltas += 1
+                for kind, text in parser.feed(delta):
+                    publish(kind, {"text": text})
+            for kind, text in parser.flush():
+                publish(kind, {"text": text})
+        record_tokens(DEEPSEEK_MODEL, usage, deltas)
         
-        # Step 1: Get detailed response with reasoning from DeepSeek-R1
-        deepseek_payload = {
-            "model": "deepseek-r1-distill-qwen-7b",
-            "messages": [
-                {"role": "system", "content": "You are an ArcGIS Enterprise expert. Think through the problem step by step and provide a detailed technical answer based on the context."},
-                {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
-            ],
-            "temperature": 0.7,
-            "max_tokens": -1,
-            "stream": False
-        }
-
-        print("Step 1: Sending request to DeepSeek-R1...")
-        deepseek_response = make_lm_studio_request(
-            "http://127.0.0.1:1234/v1/chat/completions",
-            deepseek_payload,
-            timeout=180  # 3 minutes for complex reasoning
-        )
-        
-        # deepseek_response will only be returned if successful due to make_lm_studio_request retry logic
-
-        deepseek_result = deepseek_response.json()
-        raw_answer = deepseek_result['choices'][0]['message']['content']
-        print(f"DeepSeek response length: {len(raw_answer)} characters")
+        raw_answer = parser.raw
+        logger.debug("DeepSeek response length: %d characters", len(raw_answer))
         
         # Extract reasoning and final answer
-        reasoning = ""
-        final_answer = raw_answer
-        use_granite = False
-        
-        # Look for thinking tags in the response
-        if "<think>" in raw_answer and "</think>" in raw_answer:
-            print("Found <think> tags - extracting reasoning...")
-            think_start = raw_answer.find("<think>")
-            think_end = raw_answer.find("</think>")
-            reasoning = raw_answer[think_start+7:think_end].strip()
-            final_answer = raw_answer[think_end+8:].strip()
-            print(f"Extracted reasoning ({len(reasoning)} chars) and answer ({len(final_answer)} chars)")
-            
-            # Check if final answer is well-formatted
-            if not any(marker in final_answer for marker in ["##", "**", "-", "*", "`", "1."]):
-                print("Final answer lacks formatting - will use Granite for cleanup")
-                use_granite = True
-        else:
-            print("No <think> tags found - will use Granite for formatting")
-            use_granite = True
-
-        # Step 2: Only use Granite if the answer needs formatting cleanup
-        if final_answer.strip() and use_granite:
-            print("Step 2: Sending to Granite for formatting cleanup...")
-            granite_payload = {
-                "model": "granite-3.1-8b-instruct:2",
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": "You are a technical documentation specialist. Take the provided response and create a clean, well-formatted markdown summary. Use headings, bullet points, code blocks, and clear structure. Be concise but comprehensive."
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"Please format this ArcGIS Enterprise response into clean markdown:\n\n{final_answer}"
-                    }
-                ],
-                "temperature": 0.3,
-                "max_tokens": 1024,
-                "stream": False
-            }
-            
-            granite_response = make_lm_studio_request(
-                "http://127.0.0.1:1234/v1/chat/completions",
-                granite_payload,
-                timeout=90  # 1.5 minutes for formatting
-            )
-            
-            # granite_response will only be returned if successful due to make_lm_studio_request retry logic
-            granite_result = granite_response.json()
-            summarized_answer = granite_result['choices'][0]['message']['content']
-            print(f"Granite formatted response length: {len(summarized_answer)} characters")
+        reasoning, final_answer, needs_formatting = split_reasoning(raw_answer)
+        truncated = usage.get("finish_reason") == "length" or parser.in_reasoning
+        if truncated and not final_answer.strip():
+            logger.warning("✂️ DeepSeek hit max_tokens %d while reasoning - not answering or caching", MAX_TOKENS_BY_CLASS[question_class])
+            response = truncated_response(reasoning, raw_answer)
+            publish("answer", {"text": response["answer"]})
+            return response
+
+        # Step 2: rule-based formatting first; Granite only when the rules can't give the answer structure
+        formatted = None
+        if final_answer.strip() and needs_formatting and RULE_FORMATTER_ENABLED:
+            with timed(STAGE_SECONDS, "format"):
+                result = format_markdown(final_answer)
+            FORMATTER_RUNS.inc(result="rules" if result.acceptable else "granite_fallback")
+            if result.acceptable:
+                formatted = result.markdown
+                if formatted != final_answer:
+                    publish("reset", {"stage": "formatting"})
+                    publish("answer", {"text": formatted})
+            else:
+                logger.debug("Rule-based formatting rejected (%s) - falling back to Granite", result.reason)
+
+        if final_answer.strip() and needs_formatting and formatted is None:
+            logger.debug("Step 2: Sending to Granite for formatting cleanup...")
+            publish("reset", {"stage": "formatting"})
+            summarized_answer = ""
+            usage, deltas = {}, 0
+            with timed(STAGE_SECONDS, "granite"):
+                async for delta in stream_lm_studio_request(
+                    CHAT_COMPLETIONS_URL,
+                    granite_payload(final_answer, stream=True),
+                    timeout=90,  # 1.5 minutes for formatting
+                    usage=usage
+                ):
+                    deltas += 1
+                    summarized_answer += delta
+                    publish("answer", {"text": delta})
+            record_tokens(GRANITE_MODEL, usage, deltas)
+            logger.debug("Granite formatted response length: %d characters", len(summarized_answer))
             
-            # === CACHE THE GRANITE RESPONSE ===
-            print("💾 Caching Granite-formatted response...")
-            response_to_cache = {
+            response = {
                 "answer": summarized_answer,
                 "reasoning": reasoning if reasoning else None,
                 "raw_response": final_answer,
                 "used_granite": True,
-                "cache_hit": False,
-                "cached_at": datetime.now().isoformat()
+                "formatter": "granite",
+                "cache_hit": False
             }
-            
-            # Store in semantic cache
-            try:
-                cache_document = Document(
-                    page_content=json.dumps(response_to_cache),
-                    metadata={
-                        "question": question,
-                        "timestamp": datetime.now().isoformat(),
-                        "doc_count": len(relevant_docs),
-                        "response_type": "granite"
-                    }
-                )
-                semantic_cache.add_documents([cache_document])
-                print(f"✅ Successfully cached Granite response for question: '{question[:50]}...'")
-                print(f"📊 Cache now contains response for future similar queries")
-            except Exception as cache_error:
-                print(f"❌ Failed to cache Granite response: {cache_error}")
-                import traceback
-                traceback.print_exc()
-            
-            return {
-                "answer": summarized_answer,
+        elif formatted is not None:
+            response = {
+                "answer": formatted,
                 "reasoning": reasoning if reasoning else None,
-                "raw_response": final_answer,
-                "used_granite": True,
+                "raw_response": raw_answer,
+                "used_granite": False,
+                "formatter": "rules",
                 "cache_hit": False
             }
         else:
-            print(f"Granite formatting skipped - using DeepSeek response directly")
-        
-        # === CACHE THE DEEPSEEK RESPONSE (when Granite not used or failed) ===
-        print("💾 Caching DeepSeek response...")
-        response_to_cache = {
-            "answer": final_answer,
-            "reasoning": reasoning if reasoning else None,
-            "raw_response": raw_answer,
-            "used_granite": False,
-            "cache_hit": False,
-            "cached_at": datetime.now().isoformat()
-        }
-        
-        # Store in semantic cache
-        try:
-            cache_document = Document(
-                page_content=json.dumps(response_to_cache),
-                metadata={
-                    "question": question,
-                    "timestamp": datetime.now().isoformat(),
-                    "doc_count": len(relevant_docs),
-                    "response_type": "deepseek"
-                }
-            )
-            semantic_cache.add_documents([cache_document])
-            print(f"✅ Successfully cached DeepSeek response for question: '{question[:50]}...'")
-            print(f"📊 Cache now contains response for future similar queries")
-        except Exception as cache_error:
-            print(f"❌ Failed to cache DeepSeek response: {cache_error}")
-            import traceback
-            traceback.print_exc()
+            logger.debug("Granite formatting skipped - using DeepSeek response directly")
+            response = {
+                "answer": final_answer,
+                "reasoning": reasoning if reasoning else None,
+                "raw_response": raw_answer,
+                "used_granite": False,
+                "cache_hit": False
+            }
         
-        # Use DeepSeek response directly
-        return {
-            "answer": final_answer,
-            "reasoning": reasoning if reasoning else None,
-            "raw_response": raw_answer,
-            "used_granite": False,
-            "cache_hit": False
-        }
+        # === CACHE THE RESPONSE ===
+        if truncated:
+            # The answer itself was cut off - serve it, but let the next ask generate a complete one
+            logger.warning("✂️ DeepSeek hit max_tokens %d mid-answer - not caching", MAX_TOKENS_BY_CLASS[question_class])
+            response["truncated"] = True
+            return response
+        entry = cache_entry(question, question_embedding, response, relevant_docs)
+        if cache_writes is not None:
+            cache_writes.append(entry)
+        else:
+            await cache_responses([entry])
+        return response
         
     except Exception as e:
-        error_msg = str(e)
-        print(f"❌ Error in query_rag: {error_msg}")
-        import traceback
-        traceback.print_exc()
-        
-        # Provide user-friendly error messages
-        if "timeout" in error_msg.lower():
-            return {
-                "error": "⏰ The AI model is taking longer than expected to respond. This can happen with complex questions. Please try:\n\n" +
-                        "• **Simplify your question** - Break complex queries into smaller parts\n" +
-                        "• **Check LM Studio** - Ensure models are loaded and GPU/RAM is sufficient\n" +
-                        "• **Try again** - The system will retry automatically\n" +
-                        "• **Restart LM Studio** if issues persist\n\n" +
-                        "The system supports up to 3-minute processing for complex reasoning.",
-                "timeout": True,
-                "technical_error": error_msg
-            }
-        elif "connection" in error_msg.lower():
-            return {
-                "error": "🔗 Cannot connect to LM Studio. Please ensure:\n\n" +
-                        "• **LM Studio is running** on port 1234\n" +
-                        "• **Models are loaded** (DeepSeek-R1, Granite, Nomic)\n" +
-                        "• **Local server is started** in LM Studio\n" +
-                        "• **No firewall blocking** localhost connections",
-                "connection_error": True,
-                "technical_error": error_msg
-            }
+        return error_response(e)
+
+def join_or_start_generation(question: str, question_embedding: List[float]) -> Tuple[Flight, bool]:
+    """Single-flight: share one generation between concurrent identical or near-identical questions"""
+    key = normalize_question(question)
+    flight = inflight_generations.find(key, question_embedding)
+    if flight is not None:
+        flight.followers += 1
+        logger.debug("🔗 Joining in-flight generation for '%s' (%d waiting)", flight.key[:50], flight.followers)
+        return flight, True
+    # Fail fast (before retrieval) when LM Studio's queue is already full
+    lm_scheduler.check_admission()
+    flight = inflight_generations.start(
+        key,
+        question_embedding,
+        lambda flight: generate_response(question, question_embedding, flight.publish)
+    )
+    return flight, False
+
+def request_outcome(response: dict, joined: bool = False) -> str:
+    if response.get("busy"):
+        return "rejected"
+    if response.get("provisional"):
+        return "near_hit"
+    if "error" in response:
+        return "error"
+    if response.get("cache_hit"):
+        return f"{response['cache_type']}_hit"
+    return "coalesced" if joined else "generated"
+
+def observe_request(endpoint: str, outcome: str, started: float, timings: list):
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, outcome=outcome)
+    timings.append(("total", elapsed))
+    logger.debug("%s %s in %.0fms", endpoint, outcome, elapsed * 1000)
+
+async def answer_question(question: str, allow_provisional: bool = True) -> dict:
+    try:
+        await ensure_stores()
+    except Exception as e:
+        return error_response(e)
+
+    # === EXACT-MATCH FAST PATH (no embedding needed) ===
+    cached_response = await lookup_exact_cache(question)
+    if cached_response is not None:
+        return cached_response
+    
+    # === QUESTION EMBEDDING (computed once, shared by both vector stores) ===
+    try:
+        question_embedding = await embed_question(question)
+    except Exception as e:
+        return error_response(e)
+
+    # === SEMANTIC CACHE CHECK ===
+    cached_response, near_match = await lookup_semantic_cache(question, question_embedding)
+    if cached_response is not None:
+        return cached_response
+    if not allow_provisional:
+        near_match = None
+    
+    logger.debug("🔄 Cache miss - proceeding with full RAG pipeline...")
+    try:
+        flight, joined = join_or_start_generation(question, question_embedding)
+    except SchedulerBusy as e:
+        return provisional_response(near_match, refreshing=False) if near_match is not None else error_response(e)
+    if near_match is not None:
+        # The fresh answer keeps generating in the background and is cached under this question
+        return provisional_response(near_match, refreshing=True)
+    response = await flight.wait()
+    return {**response, "coalesced": True} if joined else response
+
+async def embed_questions(questions: List[str]) -> List[List[float]]:
+    """Embeddings for many questions: cached vectors reused, the rest in BATCH_EMBED_SIZE requests"""
+    vectors = [embedding_cache.get(question) for question in questions]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    CACHE_LOOKUPS.inc(len(questions) - len(missing), cache="embedding", result="hit")
+    CACHE_LOOKUPS.inc(len(missing), cache="embedding", result="miss")
+    for start in range(0, len(missing), BATCH_EMBED_SIZE):
+        indexes = missing[start:start + BATCH_EMBED_SIZE]
+        texts = [questions[i] for i in indexes]
+        with timed(STAGE_SECONDS, "embed"):
+            embedded = await embedding.aembed_documents(texts)
+        for i, vector in zip(indexes, embedded):
+            vectors[i] = vector
+        await asyncio.to_thread(embedding_cache.put_many, texts, embedded)
+    return vectors
+
+def group_near_duplicates(embeddings: List[List[float]], threshold: float) -> List[int]:
+    """For each question, the index of the first earlier kept question within threshold (squared L2), else its own"""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    distances = norms[:, None] - 2 * vectors @ vectors.T + norms[None, :]
+    kept = np.ones(len(vectors), dtype=bool)
+    groups = list(range(len(vectors)))
+    for i in range(1, len(vectors)):
+        close = np.flatnonzero((distances[i, :i] < threshold) & kept[:i])
+        if len(close):
+            groups[i] = int(close[0])
+            kept[i] = False
+    return groups
+
+async def answer_batch(questions: List[str]) -> dict:
+    """Answer a list of questions in bulk: for offline evaluation and semantic cache pre-warming.
+
+    Exact and near-duplicate questions (closer than the semantic cache
+    threshold) are answered once. Cache lookups, embeddings and vector search
+    run once for the whole batch; cache misses are generated by BATCH_WORKERS
+    workers and written to the semantic cache in bulk.
+    """
+    await ensure_stores()
+    started = time.perf_counter()
+    results: List[Optional[dict]] = [None] * len(questions)
+
+    # === EXACT DUPLICATES + EXACT-MATCH CACHE ===
+    first_index = {}
+    representative = [first_index.setdefault(normalize_question(question), i) for i, question in enumerate(questions)]
+    unique = [i for i, rep in enumerate(representative) if rep == i]
+    with timed(STAGE_SECONDS, "exact_cache"):
+        exact = await asyncio.to_thread(response_cache.get_exact_many, [questions[i] for i in unique])
+    pending = []
+    for i, answer in zip(unique, exact):
+        if answer is not None:
+            results[i] = cached_hit_response(answer, "exact_match")
         else:
-            return {
-                "error": f"Server error: {error_msg}",
-                "technical_error": error_msg
-            }
+            pending.append(i)
+    CACHE_LOOKUPS.inc(len(unique) - len(pending), cache="exact", result="hit")
+    CACHE_LOOKUPS.inc(len(pending), cache="exact", result="miss")
+
+    if pending:
+        # === EMBEDDINGS + NEAR-DUPLICATES ===
+        embeddings = dict(zip(pending, await embed_questions([questions[i] for i in pending])))
+        groups = group_near_duplicates([embeddings[i] for i in pending], SEMANTIC_SIMILARITY_THRESHOLD)
+        for i, group in zip(pending, groups):
+            representative[i] = pending[group]
+        pending = [i for i in pending if representative[i] == i]
+
+        # === SEMANTIC CACHE ===
+        with timed(STAGE_SECONDS, "semantic_cache"):
+            nearest = await asyncio.to_thread(response_cache.search_many, [embeddings[i] for i in pending], 3)
+        misses = []
+        for i, cache_results in zip(pending, nearest):
+            results[i] = match_cached_answer(questions[i], cache_results)
+            if results[i] is None:
+                misses.append(i)
+        CACHE_LOOKUPS.inc(len(pending) - len(misses), cache="semantic", result="hit")
+        CACHE_LOOKUPS.inc(len(misses), cache="semantic", result="miss")
+
+        if misses:
+            # === VECTOR SEARCH FOR THE WHOLE BATCH, THEN A BOUNDED GENERATION POOL ===
+            with timed(STAGE_SECONDS, "vector_search"):
+                vector_docs = await asyncio.to_thread(vector_search_many_sync, [embeddings[i] for i in misses])
+            logger.info("📚 Batch: %d questions, %d to generate with %d workers", len(questions), len(misses), BATCH_WORKERS)
+            workers = asyncio.Semaphore(BATCH_WORKERS)
+            cache_writes: List[tuple] = []
+
+            async def flush_cache_writes(minimum: int):
+                if len(cache_writes) >= minimum:
+                    entries = cache_writes[:]
+                    cache_writes.clear()
+                    await cache_responses(entries)
+
+            async def generate(i: int, docs: list):
+                # Bulk work yields to live traffic: a full queue means wait and retry, not fail fast like /query
+                deadline = time.monotonic() + BATCH_BUSY_TIMEOUT
+                async with workers:
+                    while True:
+                        try:
+                            results[i] = await generate_response(questions[i], embeddings[i], lambda event, data: None, docs, cache_writes)
+                        except Exception as e:
+                            results[i] = error_response(e)
+                        if not results[i].get("busy") or time.monotonic() >= deadline:
+                            break
+                        await asyncio.sleep(min(max(results[i]["retry_after"], 1), BATCH_BUSY_MAX_SLEEP))
+                await flush_cache_writes(BATCH_CACHE_WRITE_SIZE)
+
+            await asyncio.gather(*(generate(i, docs) for i, docs in zip(misses, vector_docs)))
+            await flush_cache_writes(1)
+
+    # === ONE RESULT PER INPUT QUESTION, IN ORDER ===
+    answers = []
+    summary = Counter()
+    for i, question in enumerate(questions):
+        root = i
+        while representative[root] != root:
+            root = representative[root]
+        response = {"question": question, **results[root]}
+        if root != i:
+            response["duplicate_of"] = questions[root]
+            result = "duplicate"
+        else:
+            result = request_outcome(results[root])
+        BATCH_QUESTIONS.inc(result=result)
+        summary[result] += 1
+        answers.append(response)
+    return {
+        "results": answers,
+        "summary": {"questions": len(questions), **summary, "seconds": round(time.perf_counter() - started, 3)}
+    }
+
+# === WARM-UP (runs in the background from lifespan; progress is reported by /ready) ===
+_warm_embedding: List[float] = []
+
+async def warm_embedding():
+    """First embedding call: makes LM Studio load the Nomic model"""
+    _warm_embedding[:] = await embedding.aembed_query("warm-up")
+    return {"dimensions": len(_warm_embedding)}
+
+def warm_redis():
+    connected = doc_cache.check()
+    if connected:
+        logger.info("✅ Redis connected for document caching")
+    return {"connected": connected}
+
+def warm_indexes():
+    """One nearest-neighbour query per collection pages the HNSW indexes (and the mmap matrix) into memory"""
+    if not _warm_embedding:
+        raise RuntimeError("no warm-up embedding")
+    warmed = []
+    for name, store in (("chunks", vectorstore), ("cached_answers", semantic_cache)):
+        if store._collection.count():
+            store._collection.query(query_embeddings=[_warm_embedding], n_results=1)
+            warmed.append(name)
+    if vector_index is not None:
+        vector_index.search(_warm_embedding, 1)
+        warmed.append("vector_index")
+    return {"warmed": warmed}
+
+async def warm_model(model: str):
+    """1-token completion so LM Studio has the model loaded before the first real question"""
+    await make_lm_studio_request(
+        CHAT_COMPLETIONS_URL,
+        {"model": model, "messages": [{"role": "user", "content": "Hi"}], "max_tokens": 1},
+        timeout=WARMUP_MODEL_TIMEOUT,
+        max_retries=0
+    )
+
+def warm_hot_cache():
+    """Preload embeddings of the most hit cached questions, so their repeats skip the embedding call"""
+    loaded = 0
+    for question, vector in response_cache.hottest(WARMUP_HOT_ENTRIES):
+        if embedding_cache.get(question) is None:
+            embedding_cache.put(question, vector)
+            loaded += 1
+    return {"embeddings_loaded": loaded}
+
+warmup = WarmupTracker()
+warmup.add("stores", ensure_stores, required=True)
+warmup.add("redis", lambda: asyncio.to_thread(warm_redis))
+if WARMUP_ENABLED:
+    warmup.add("embedding", warm_embedding, timeout=WARMUP_MODEL_TIMEOUT)
+    warmup.add("indexes", lambda: asyncio.to_thread(warm_indexes))
+    warmup.add("deepseek", lambda: warm_model(DEEPSEEK_MODEL), timeout=WARMUP_MODEL_TIMEOUT)
+    warmup.add("granite", lambda: warm_model(GRANITE_MODEL), timeout=WARMUP_MODEL_TIMEOUT)
+    warmup.add("hot_cache", lambda: asyncio.to_thread(warm_hot_cache))
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe for the load balancer: 503 until the stores are open and warm-up has run"""
+    return JSONResponse(warmup.snapshot(), status_code=200 if warmup.ready else 503)
+
+@app.post("/query")
+async def query_rag(request: Request, response: Response):
+    started = time.perf_counter()
+    timings = track_request()
+    body = await request.json()
+    question = body.get("question")
+    logger.debug("🔍 Processing query: '%s' (cache threshold: %s)", question, SEMANTIC_SIMILARITY_THRESHOLD)
+
+    result = await answer_question(question, body.get("allow_provisional", True))
+    observe_request("/query", request_outcome(result, result.get("coalesced", False)), started, timings)
+    response.headers["Server-Timing"] = server_timing(timings)
+    if result.get("busy"):
+        response.status_code = 503
+        response.headers["Retry-After"] = str(result["retry_after"])
+    return result
+
+@app.post("/query/batch")
+async def query_rag_batch(request: Request, response: Response):
+    """Answer up to BATCH_MAX_QUESTIONS questions: {"questions": [...]} -> {"results": [...], "summary": {...}}"""
+    started = time.perf_counter()
+    body = await request.json()
+    questions = body.get("questions")
+    if not isinstance(questions, list) or not all(isinstance(question, str) and question.strip() for question in questions):
+        response.status_code = 400
+        return {"error": "\"questions\" must be a list of non-empty strings"}
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        response.status_code = 400
+        return {"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch - send the rest in another request"}
+    if not questions:
+        return {"results": [], "summary": {"questions": 0, "seconds": 0.0}}
+
+    try:
+        result = await answer_batch(questions)
+    except Exception as e:
+        result = error_response(e)
+        if result.get("busy"):
+            response.status_code = 503
+            response.headers["Retry-After"] = str(result["retry_after"])
+        else:
+            response.status_code = 500
+    observe_request("/query/batch", "error" if "error" in result else "completed", started, [])
+    return result
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_rag_stream(request: Request):
+    """Streaming variant of /query: relays LM Studio tokens as Server-Sent Events.
+
+    Events: ``reasoning``/``answer`` carry ``{"text": delta}``; ``reset`` means the
+    answer streamed so far is being replaced by the Granite-formatted version;
+    ``done`` carries the same JSON body /query would return; ``error`` carries
+    the /query error body. On a near hit, ``provisional`` first carries the
+    closest cached answer; the fresh answer then streams as usual.
+    """
+    body = await request.json()
+    question = body.get("question")
+    allow_provisional = body.get("allow_provisional", True)
+    logger.debug("🔍 Processing streaming query: '%s'", question)
+
+    async def event_stream():
+        # Headers are sent before any stage runs, so stage timings only reach /metrics here
+        started = time.perf_counter()
+        timings = track_request()
+        outcome = "error"
+        try:
+            await ensure_stores()
+            cached_response = await lookup_exact_cache(question)
+            if cached_response is not None:
+                outcome = request_outcome(cached_response)
+                yield sse_event("done", cached_response)
+                return
+
+            question_embedding = await embed_question(question)
+
+            cached_response, near_match = await lookup_semantic_cache(question, question_embedding)
+            if cached_response is not None:
+                outcome = request_outcome(cached_response)
+                yield sse_event("done", cached_response)
+                return
+            provisional = provisional_response(near_match, refreshing=True) if near_match and allow_provisional else None
+            if provisional is not None:
+                yield sse_event("provisional", provisional)
+
+            logger.debug("🔄 Cache miss - proceeding with full RAG pipeline...")
+            try:
+                flight, joined = join_or_start_generation(question, question_embedding)
+            except SchedulerBusy:
+                if provisional is None:
+                    raise
+                # No room for a fresh answer right now - the provisional one is all there is
+                response = {**provisional, "refreshing": False}
+                outcome = request_outcome(response)
+                yield sse_event("done", response)
+                return
+            async for event, data in flight.follow():
+                yield sse_event(event, data)
+            response = await flight.wait()
+            if joined:
+                response = {**response, "coalesced": True}
+            outcome = request_outcome(response, joined)
+            yield sse_event("error" if "error" in response else "done", response)
+
+        except Exception as e:
+            response = error_response(e)
+            outcome = request_outcome(response)
+            yield sse_event("error", response)
+        finally:
+            observe_request("/query/stream", outcome, started, timings)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: stage/request latency histograms, cache and token counters"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # Add a debug endpoint to check cache contents
 @app.get("/debug/cache")
 async def debug_cache():
     try:
-        # Get all cached items
-        cache_results = semantic_cache.similarity_search("", k=10)
+        await ensure_stores()
+        # Sample of cached items (no embedding call needed)
+        cache_results = await asyncio.to_thread(response_cache.peek, 10)
         cache_info = []
         
-        for doc in cache_results:
-            try:
-                cached_data = json.loads(doc.page_content)
+        for answer in cache_results:
+            if answer.response:
                 cache_info.append({
-                    "question": doc.metadata.get('question', 'N/A')[:100],
-                    "timestamp": doc.metadata.get('timestamp', 'N/A'),
-                    "response_type": doc.metadata.get('response_type', 'unknown'),
-                    "answer_preview": cached_data.get('answer', 'N/A')[:100] + "..." if cached_data.get('answer') else 'N/A'
+                    "question": answer.question[:100],
+                    "timestamp": answer.metadata.get('timestamp', 'N/A'),
+                    "response_type": answer.metadata.get('response_type', 'unknown'),
+                    "hits": answer.metadata.get('hits', 0),
+                    "answer_preview": answer.response.get('answer', 'N/A')[:100] + "..." if answer.response.get('answer') else 'N/A'
                 })
-            except:
+            else:
                 cache_info.append({
-                    "question": doc.metadata.get('question', 'N/A'),
+                    "question": answer.question,
                     "error": "Failed to parse cached response"
                 })
         
         return {
             "cache_count": len(cache_info),
+            "total_entries": await asyncio.to_thread(response_cache.count),
+            "max_entries": SEMANTIC_CACHE_MAX_ENTRIES,
+            "ttl_seconds": SEMANTIC_CACHE_TTL,
             "cached_items": cache_info,
-            "threshold": SEMANTIC_SIMILARITY_THRESHOLD
+            "threshold": SEMANTIC_SIMILARITY_THRESHOLD,
+            "document_cache": doc_cache.stats(),
+            "lm_scheduler": lm_scheduler.stats()
         }
     except Exception as e:
         return {"error": f"Failed to debug cache: {str(e)}"}
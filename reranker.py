@@ -0,0 +1,104 @@
+import logging
+import time
+from typing import List, NamedTuple, Optional, Sequence
+
+from lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # ~22M params, a few ms per pair on CPU
+IDENTIFIER_WEIGHT = 2.0   # Compound identifiers and numbers (ports, versions) count double
+BIGRAM_WEIGHT = 0.5       # Bonus for question word pairs appearing next to each other
+
+
+class LexicalOverlapScorer:
+    """Cheap scorer: weighted share of question terms (and adjacent pairs) found in the chunk"""
+
+    name = "lexical"
+
+    @staticmethod
+    def _weight(term: str) -> float:
+        return IDENTIFIER_WEIGHT if term.isdigit() or not term.isalnum() else 1.0
+
+    def score(self, question: str, texts: Sequence[str]) -> List[float]:
+        question_terms = tokenize(question)
+        terms = set(question_terms)
+        total = sum(self._weight(term) for term in terms)
+        bigrams = set(zip(question_terms, question_terms[1:]))
+        scores = []
+        for text in texts:
+            chunk_terms = tokenize(text)
+            present = set(chunk_terms)
+            coverage = sum(self._weight(term) for term in terms & present) / total if total else 0.0
+            pairs = len(bigrams & set(zip(chunk_terms, chunk_terms[1:]))) / len(bigrams) if bigrams else 0.0
+            scores.append(coverage + BIGRAM_WEIGHT * pairs)
+        return scores
+
+
+class CrossEncoderScorer:
+    """Small sentence-transformers cross-encoder run on the CPU"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER):
+        # Optional and slow to import (torch): pip install sentence-transformers
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, question: str, texts: Sequence[str]) -> List[float]:
+        return [float(score) for score in self.model.predict([(question, text) for text in texts], batch_size=len(texts))]
+
+
+class RerankResult(NamedTuple):
+    docs: list
+    scored: int
+    over_budget: bool
+
+
+class Reranker:
+    """Re-scores retrieved chunks in batches and keeps the best ``top_n``.
+
+    Batches are scored until ``budget_seconds`` runs out; chunks left unscored
+    rank after the scored ones, in their original retrieval order.
+    """
+
+    def __init__(self, scorer, top_n: int = 4, budget_seconds: float = 0.15, batch_size: int = 8):
+        self.scorer = scorer
+        self.top_n = top_n
+        self.budget_seconds = budget_seconds
+        self.batch_size = batch_size
+
+    def rerank(self, question: str, docs: list) -> RerankResult:
+        """Blocking (cross-encoder inference), so call it from a worker thread"""
+        if len(docs) <= 1:
+            return RerankResult(list(docs), 0, False)
+        started = time.perf_counter()
+        scores: List[float] = []
+        over_budget = False
+        for start in range(0, len(docs), self.batch_size):
+            if start and time.perf_counter() - started > self.budget_seconds:
+                over_budget = True
+                break
+            batch = docs[start:start + self.batch_size]
+            scores.extend(self.scorer.score(question, [doc.page_content for doc in batch]))
+        # Stable sort: equal scores keep the retrieval (fusion) order
+        scored = sorted(range(len(scores)), key=lambda index: scores[index], reverse=True)
+        order = scored + list(range(len(scores), len(docs)))
+        return RerankResult([docs[index] for index in order[:self.top_n]], len(scores), over_budget)
+
+
+def make_reranker(kind: Optional[str], top_n: int, budget_seconds: float, batch_size: int,
+                  model_name: str = DEFAULT_CROSS_ENCODER) -> Optional[Reranker]:
+    """"lexical", "cross-encoder" (falls back to lexical if it cannot load) or None for no reranking"""
+    if not kind:
+        return None
+    scorer = None
+    if kind == "cross-encoder":
+        try:
+            scorer = CrossEncoderScorer(model_name)
+            logger.info("🎯 Reranking with cross-encoder %s", model_name)
+        except Exception as e:
+            logger.warning("⚠️  Cross-encoder unavailable (%s) - reranking by lexical overlap", e)
+    elif kind != "lexical":
+        raise ValueError(f"Unknown reranker: {kind}")
+    return Reranker(scorer or LexicalOverlapScorer(), top_n, budget_seconds, batch_size)
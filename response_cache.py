@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from text_utils import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+class CachedAnswer(NamedTuple):
+    entry_id: str
+    question: str
+    response: dict
+    metadata: dict
+    distance: float
+
+
+def question_id(question: str) -> str:
+    """Stable cache entry id for a question, so re-asking upserts instead of appending"""
+    return "q:" + hashlib.sha256(normalize_question(question).encode()).hexdigest()
+
+
+class SemanticResponseCache:
+    """Bounded, TTL-enforced answer cache on top of the ``rag_responses`` Chroma collection.
+
+    Entries are keyed by the hash of the normalized question (exact-match lookups
+    never need an embedding) and indexed by the question embedding for
+    similarity lookups. Hits are counted in memory and flushed to the entry
+    metadata when the cache is trimmed, which keeps the hot path read-only.
+    """
+
+    def __init__(self, store, ttl_seconds: int, max_entries: int, eviction_policy: str = "lru",
+                 on_evict: Optional[Callable[[List[str]], None]] = None):
+        if eviction_policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {eviction_policy}")
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.eviction_policy = eviction_policy
+        self.on_evict = on_evict  # Called with the ids of expired and evicted entries
+        self._pending_hits: Dict[str, List[float]] = {}  # entry_id -> [last_hit, hit_count]
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        return self.store._collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def _created_at(self, metadata: dict) -> float:
+        if "created_at" in metadata:
+            return float(metadata["created_at"])
+        # Entries written before TTL tracking only carry an ISO timestamp
+        try:
+            return datetime.fromisoformat(metadata["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return 0.0
+
+    def is_expired(self, metadata: dict, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - self._created_at(metadata) > self.ttl_seconds
+
+    def _to_answer(self, entry_id: str, document: str, metadata: Optional[dict], distance: float) -> Optional[CachedAnswer]:
+        metadata = metadata or {}
+        if self.is_expired(metadata):
+            logger.debug("⌛ Cached answer expired for: %s", metadata.get("question", "N/A")[:50])
+            self.collection.delete(ids=[entry_id])
+            if self.on_evict is not None:
+                self.on_evict([entry_id])
+            return None
+        try:
+            response = json.loads(document)
+        except (TypeError, json.JSONDecodeError) as json_error:
+            logger.warning("❌ Failed to parse cached response JSON: %s", json_error)
+            return None
+        return CachedAnswer(entry_id, metadata.get("question", ""), response, metadata, distance)
+
+    def get_exact(self, question: str) -> Optional[CachedAnswer]:
+        """Hash lookup on the normalized question - no embedding required"""
+        return self.get_exact_many([question])[0]
+
+    def get_exact_many(self, questions: Sequence[str]) -> List[Optional[CachedAnswer]]:
+        """``get_exact`` for several questions in one collection read"""
+        if not questions:
+            return []
+        entry_ids = [question_id(question) for question in questions]
+        result = self.collection.get(ids=list(dict.fromkeys(entry_ids)), include=["documents", "metadatas"])
+        found = {
+            entry_id: self._to_answer(entry_id, document, metadata, 0.0)
+            for entry_id, document, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [found.get(entry_id) for entry_id in entry_ids]
+
+    def search(self, embedding: List[float], k: int = 3) -> List[CachedAnswer]:
+        """Nearest cached questions by embedding distance, expired entries dropped"""
+        return self.search_many([embedding], k)[0]
+
+    def search_many(self, embeddings: Sequence[List[float]], k: int = 3) -> List[List[CachedAnswer]]:
+        """``search`` for a batch of embeddings in one collection query"""
+        if not embeddings or self.count() == 0:
+            return [[] for _ in embeddings]
+        result = self.collection.query(
+            query_embeddings=list(embeddings),
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+        batches = []
+        for ids, documents, metadatas, distances in zip(
+            result["ids"], result["documents"], result["metadatas"], result["distances"]
+        ):
+            answers = []
+            for entry_id, document, metadata, distance in zip(ids, documents, metadatas, distances):
+                answer = self._to_answer(entry_id, document, metadata, distance)
+                if answer is not None:
+                    answers.append(answer)
+            batches.append(answers)
+        return batches
+
+    def record_hit(self, entry_id: str):
+        with self._lock:
+            hits = self._pending_hits.get(entry_id, (0.0, 0))[1]
+            self._pending_hits[entry_id] = [time.time(), hits + 1]
+
+    def put(self, question: str, embedding: List[float], response: dict, metadata: dict):
+        """Upsert the answer for a question, then trim the cache if it grew past max_entries"""
+        self.put_many([(question, embedding, response, metadata)])
+
+    def put_many(self, entries: Sequence[Tuple[str, List[float], dict, dict]]):
+        """Upsert (question, embedding, response, metadata) entries in one write, trimming once"""
+        # One entry per question id (the last one wins), as upsert rejects duplicate ids
+        entries = list({question_id(entry[0]): entry for entry in entries}.items())
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            for entry_id, _ in entries:
+                self._pending_hits.pop(entry_id, None)
+        self.collection.upsert(
+            ids=[entry_id for entry_id, _ in entries],
+            embeddings=[embedding for _, (_, embedding, _, _) in entries],
+            documents=[json.dumps(response) for _, (_, _, response, _) in entries],
+            metadatas=[
+                {**metadata, "question": question, "created_at": now, "last_hit": now, "hits": 0}
+                for _, (question, _, _, metadata) in entries
+            ],
+        )
+        if self.count() > self.max_entries:
+            self.evict()
+
+    def delete(self, entry_ids: Sequence[str]):
+        """Drop entries whose source chunks changed"""
+        if not entry_ids:
+            return
+        with self._lock:
+            for entry_id in entry_ids:
+                self._pending_hits.pop(entry_id, None)
+        self.collection.delete(ids=list(entry_ids))
+
+    def drop_legacy(self) -> int:
+        """Delete entries written before answers were keyed by question id.
+
+        Those were indexed by the embedding of the answer JSON, so their
+        distances to a question embedding mean nothing against the thresholds.
+        """
+        result = self.collection.get(include=[])
+        legacy = [entry_id for entry_id in result["ids"] if not entry_id.startswith("q:")]
+        if legacy:
+            self.delete(legacy)
+            if self.on_evict is not None:
+                self.on_evict(legacy)
+            logger.info("🧹 Dropped %d semantic cache entries indexed by answer embeddings", len(legacy))
+        return len(legacy)
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently (lru) or least frequently (lfu) used overflow.
+
+        Trims down to 90% of max_entries so a full cache is not rescanned on every insert.
+        """
+        with self._lock:
+            pending_hits, self._pending_hits = self._pending_hits, {}
+        result = self.collection.get(include=["metadatas"])
+        now = time.time()
+        expired, live = [], []
+        updated_ids, updated_metadatas = [], []
+        for entry_id, metadata in zip(result["ids"], result["metadatas"]):
+            metadata = metadata or {}
+            if self.is_expired(metadata, now):
+                expired.append(entry_id)
+                continue
+            last_hit = float(metadata.get("last_hit", self._created_at(metadata)))
+            hits = int(metadata.get("hits", 0))
+            if entry_id in pending_hits:
+                last_hit, new_hits = pending_hits[entry_id]
+                hits += new_hits
+                updated_ids.append(entry_id)
+                updated_metadatas.append({**metadata, "last_hit": last_hit, "hits": hits})
+            live.append((entry_id, last_hit, hits))
+        if updated_ids:
+            self.collection.update(ids=updated_ids, metadatas=updated_metadatas)
+
+        overflow = len(live) - self.max_entries
+        if overflow > 0:
+            overflow = len(live) - int(self.max_entries * 0.9)
+        evicted = []
+        if overflow > 0:
+            if self.eviction_policy == "lfu":
+                live.sort(key=lambda entry: (entry[2], entry[1]))
+            else:
+                live.sort(key=lambda entry: entry[1])
+            evicted = [entry_id for entry_id, _, _ in live[:overflow]]
+
+        to_delete = expired + evicted
+        if to_delete:
+            self.collection.delete(ids=to_delete)
+            if self.on_evict is not None:
+                self.on_evict(to_delete)
+            logger.info("🧹 Semantic cache trimmed: %d expired, %d evicted (%s)", len(expired), len(evicted), self.eviction_policy)
+        return len(to_delete)
+
+    def peek(self, limit: int = 10) -> List[CachedAnswer]:
+        result = self.collection.get(limit=limit, include=["documents", "metadatas"])
+        answers = []
+        for entry_id, document, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+            try:
+                response = json.loads(document)
+            except (TypeError, json.JSONDecodeError):
+                response = {}
+            answers.append(CachedAnswer(entry_id, (metadata or {}).get("question", ""), response, metadata or {}, 0.0))
+        return answers
+
+    def hottest(self, limit: int = 100) -> List[Tuple[str, List[float]]]:
+        """(question, embedding) of the most hit live entries, for warming the embedding cache"""
+        result = self.collection.get(include=["metadatas", "embeddings"])
+        now = time.time()
+        entries = [
+            (int((metadata or {}).get("hits", 0)), (metadata or {}).get("question", ""), embedding)
+            for metadata, embedding in zip(result["metadatas"], result["embeddings"])
+            if not self.is_expired(metadata or {}, now)
+        ]
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        return [(question, [float(x) for x in embedding]) for _, question, embedding in entries[:limit] if question]
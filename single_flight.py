@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def squared_l2(a: List[float], b: List[float]) -> float:
+    """Same distance Chroma reports for its default "l2" space"""
+    return sum((x - y) * (x - y) for x, y in zip(a, b))
+
+
+class Flight:
+    """One in-progress generation that concurrent requests can subscribe to.
+
+    Stream events are kept in order so a subscriber that joins late replays
+    everything published so far before following live.
+    """
+
+    def __init__(self, key: str, embedding: List[float]):
+        self.key = key
+        self.embedding = embedding
+        self.events: List[Tuple[str, Any]] = []
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: str, data: Any):
+        self.events.append((event, data))
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Tuple[str, Any]]:
+        """Replay and then follow published events until the generation finishes"""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+    async def wait(self) -> dict:
+        """Final result of the generation; cancelling a waiter never cancels the generation"""
+        await asyncio.shield(self.task)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class InFlightRegistry:
+    """Single-flight registry keyed by normalized question, with embedding-neighbour matching"""
+
+    def __init__(self, similarity_threshold: float):
+        self.similarity_threshold = similarity_threshold
+        self._flights: Dict[str, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def find(self, key: str, embedding: List[float]) -> Optional[Flight]:
+        flight = self._flights.get(key)
+        if flight is not None:
+            return flight
+        best_flight, best_distance = None, self.similarity_threshold
+        for candidate in self._flights.values():
+            distance = squared_l2(embedding, candidate.embedding)
+            if distance < best_distance:
+                best_flight, best_distance = candidate, distance
+        return best_flight
+
+    def start(self, key: str, embedding: List[float], generate: Callable[[Flight], Awaitable[dict]]) -> Flight:
+        """Run generate(flight) as a background task other requests can join"""
+        flight = Flight(key, embedding)
+        self._flights[key] = flight
+        flight.task = asyncio.create_task(self._run(flight, generate))
+        return flight
+
+    async def _run(self, flight: Flight, generate: Callable[[Flight], Awaitable[dict]]):
+        try:
+            flight.result = await generate(flight)
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight._wake()
+            self._flights.pop(flight.key, None)
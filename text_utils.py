@@ -0,0 +1,11 @@
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form of a question for cache keys ("How do I add a server?" == "how do i add a server")"""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return text.rstrip("?.! ")
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_DIR = "vector_index"
+DEFAULT_DTYPE = "int8"     # "int8" (1 byte/dim, per-row scale) or "float16" (2 bytes/dim)
+BLOCK_ROWS = 1024          # Rows dequantized to float32 at a time while loading
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"        # Pointer file naming the version directory readers should open
+KEEP_VERSIONS = 2          # Version directories kept (current + previous, which readers may still map)
+
+
+class _Snapshot(NamedTuple):
+    ids: List[str]
+    chunks: Dict[str, Tuple[str, dict]]  # id -> (text, metadata)
+    matrix: np.ndarray                    # Dequantized float32 rows (int8 scales folded in)
+    norms: np.ndarray                     # Squared norms of the stored (dequantized) rows
+
+
+class MmapVectorIndex:
+    """Brute-force nearest-chunk search over an embedding matrix stored as float16/int8.
+
+    Files are written by ``build_index`` (from chroma_data or at the end of a
+    crawl) into a version directory under ``path``; the ``CURRENT`` file names
+    the one to open. The compact matrix is dequantized to float32 once, when a
+    version is loaded, so each search is a single BLAS matrix product. Distances are squared L2 like Chroma's default space, so the same
+    ``distance < 1`` relevance cutoff applies. Chunk text and metadata are kept
+    alongside, so a search needs no Chroma or SQLite round trip at all.
+    """
+
+    def __init__(self, path: str = VECTOR_INDEX_DIR):
+        self.path = path
+        self.version = None
+        self._pointer_mtime = None
+        self.load()
+
+    def load(self):
+        """(Re)open the current version; searches already running keep using the previous snapshot"""
+        self._pointer_mtime = _pointer_mtime(self.path)
+        version = current_version(self.path)
+        directory = os.path.join(self.path, version) if version else self.path  # No pointer: pre-versioning layout
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        with open(os.path.join(directory, "chunks.json")) as f:
+            chunks = json.load(f)
+        self.dtype = manifest["dtype"]
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        scales = np.load(os.path.join(directory, "scales.npy")) if self.dtype == "int8" else None
+        self._snapshot = _Snapshot(
+            [chunk["id"] for chunk in chunks],
+            {chunk["id"]: (chunk["text"], chunk["metadata"]) for chunk in chunks},
+            _dequantize(vectors, scales),
+            np.load(os.path.join(directory, "norms.npy")),
+        )
+        self.version = version
+        logger.info("🧭 Vector index: %d chunks x %d dims (%s) from %s", len(self), manifest["dim"], self.dtype, directory)
+
+    def reload_if_changed(self) -> bool:
+        """Pick up an index rebuilt by the crawler (a stat call unless the pointer was rewritten)"""
+        mtime = _pointer_mtime(self.path)
+        if mtime == self._pointer_mtime:
+            return False
+        self._pointer_mtime = mtime
+        if current_version(self.path) == self.version:
+            return False
+        self.load()
+        return True
+
+    def __len__(self) -> int:
+        return len(self._snapshot.ids)
+
+    def search(self, embedding: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        """The ``k`` nearest chunk ids with their squared L2 distances, nearest first"""
+        return self.search_many([embedding], k)[0]
+
+    def search_many(self, embeddings: Sequence[Sequence[float]], k: int) -> List[List[Tuple[str, float]]]:
+        """``search`` for a batch of queries, in one matrix product"""
+        snapshot = self._snapshot
+        count = len(snapshot.ids)
+        if not count or not len(embeddings):
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        distances = snapshot.norms - 2 * (queries @ snapshot.matrix.T) + np.einsum("ij,ij->i", queries, queries)[:, None]
+        k = min(k, count)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(distances, nearest):
+            candidates = candidates[np.argsort(row[candidates])]
+            results.append([(snapshot.ids[i], float(row[i])) for i in candidates])
+        return results
+
+    def get(self, chunk_ids: Sequence[str]) -> Dict[str, Tuple[str, dict]]:
+        """(text, metadata) of the given chunks that are in the index"""
+        chunks = self._snapshot.chunks
+        return {chunk_id: chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks}
+
+
+def _dequantize(vectors: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    """float32 copy of the stored rows, converted a block at a time so the file is read once"""
+    matrix = np.empty(vectors.shape, dtype=np.float32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = matrix[start:start + BLOCK_ROWS]
+        block[:] = vectors[start:start + BLOCK_ROWS]
+        if scales is not None:
+            block *= scales[start:start + BLOCK_ROWS, None]
+    return matrix
+
+
+def _pointer_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(os.path.join(path, CURRENT)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def current_version(path: str = VECTOR_INDEX_DIR) -> Optional[str]:
+    """Name of the version directory ``CURRENT`` points at, or None (no pointer yet)"""
+    try:
+        with open(os.path.join(path, CURRENT)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def index_dtype(path: str = VECTOR_INDEX_DIR) -> Optional[str]:
+    """dtype of the index at ``path``, or None if it has not been built yet"""
+    version = current_version(path)
+    try:
+        with open(os.path.join(path, version, MANIFEST) if version else os.path.join(path, MANIFEST)) as f:
+            return json.load(f)["dtype"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def build_index(collection, path: str = VECTOR_INDEX_DIR, dtype: str = DEFAULT_DTYPE) -> int:
+    """Write the collection's embeddings, texts and metadata as a memory-mappable index.
+
+    Each build goes to a new version directory under ``path``; replacing the
+    ``CURRENT`` pointer then publishes it atomically. Directories that running
+    API workers have memory-mapped are never renamed (Windows refuses, and
+    POSIX readers would never notice), and the previous version is kept so
+    readers can switch over. Returns the number of chunks.
+    """
+    if dtype not in ("int8", "float16"):
+        raise ValueError(f"Unknown vector index dtype: {dtype}")
+    started = time.perf_counter()
+    stored = collection.get(include=["embeddings", "documents", "metadatas"])
+    ids = list(stored["ids"])
+    embeddings = np.asarray(stored["embeddings"] if len(ids) else np.zeros((0, 0)), dtype=np.float32)
+
+    version = f"v{time.time_ns()}"
+    scratch = os.path.join(path, version)
+    os.makedirs(scratch)
+    if dtype == "int8":
+        scales = (np.abs(embeddings).max(axis=1) / 127).astype(np.float32) if len(ids) else np.zeros(0, np.float32)
+        scales[scales == 0] = 1.0
+        vectors = np.round(embeddings / scales[:, None]).astype(np.int8)
+        stored_rows = vectors.astype(np.float32) * scales[:, None]
+        np.save(os.path.join(scratch, "scales.npy"), scales)
+    else:
+        vectors = embeddings.astype(np.float16)
+        stored_rows = vectors.astype(np.float32)
+    np.save(os.path.join(scratch, "vectors.npy"), vectors)
+    np.save(os.path.join(scratch, "norms.npy"), np.einsum("ij,ij->i", stored_rows, stored_rows).astype(np.float32))
+    with open(os.path.join(scratch, "chunks.json"), "w") as f:
+        json.dump(
+            [
+                {"id": chunk_id, "text": text, "metadata": metadata or {}}
+                for chunk_id, text, metadata in zip(ids, stored["documents"], stored["metadatas"])
+            ],
+            f,
+        )
+    with open(os.path.join(scratch, MANIFEST), "w") as f:
+        json.dump({"dtype": dtype, "count": len(ids), "dim": int(vectors.shape[1]) if len(ids) else 0, "built_at": time.time()}, f)
+
+    pointer = os.path.join(path, f"{CURRENT}.tmp-{os.getpid()}")
+    with open(pointer, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(path, CURRENT))
+    _remove_old_versions(path)
+    logger.info("🧭 Built %s vector index of %d chunks in %.1fs", dtype, len(ids), time.perf_counter() - started)
+    return len(ids)
+
+
+def _remove_old_versions(path: str):
+    """Delete all but the newest KEEP_VERSIONS builds (and a pre-versioning index in ``path`` itself).
+
+    A version some worker still has mapped cannot be deleted on Windows;
+    it is skipped and removed by a later build.
+    """
+    versions = sorted(name for name in os.listdir(path) if name.startswith("v") and os.path.isdir(os.path.join(path, name)))
+    for name in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    for name in (MANIFEST, "chunks.json", "vectors.npy", "norms.npy", "scales.npy"):
+        try:
+            os.remove(os.path.join(path, name))
+        except OSError:
+            pass
+
+
+def open_index(path: str = VECTOR_INDEX_DIR) -> Optional[MmapVectorIndex]:
+    """The index at ``path``, or None if it has not been built yet"""
+    if current_version(path) is None and not os.path.exists(os.path.join(path, MANIFEST)):
+        return None
+    return MmapVectorIndex(path)
+
+
+if __name__ == "__main__":
+    # Build the index from an existing chroma_data without re-crawling
+    import argparse
+
+    from chroma_store import open_store
+    from lm_client import NomicEmbedding
+
+    parser = argparse.ArgumentParser(description="Build the memory-mapped vector index from chroma_data")
+    parser.add_argument("--dtype", choices=["int8", "float16"], default=DEFAULT_DTYPE)
+    parser.add_argument("--path", default=VECTOR_INDEX_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    build_index(open_store("./chroma_data", NomicEmbedding())._collection, args.path, args.dtype)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 2     # First retry of a failed required step; doubles after each failure
+RETRY_MAX_SECONDS = 60     # Longest wait between retries
+
+
+class WarmupTracker:
+    """Runs named warm-up steps in order and reports their progress for a readiness probe.
+
+    The instance is ready once every step has finished. A failed step (e.g.
+    LM Studio not reachable yet) is reported but does not block readiness,
+    except for ``required`` steps, which the instance cannot serve without.
+    Failed required steps are retried with backoff until they succeed, so a
+    dependency that comes up late (e.g. the Chroma server) makes the instance
+    ready without a restart.
+    """
+
+    def __init__(self):
+        self.steps: Dict[str, dict] = {}
+        self._plan: List[Tuple[str, Callable[[], Awaitable], float, bool]] = []
+        self.started_at = time.time()
+        self.finished = False
+
+    def add(self, name: str, step: Callable[[], Awaitable], timeout: float = 60, required: bool = False):
+        self._plan.append((name, step, timeout, required))
+        self.steps[name] = {"status": "pending", "required": required}
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable], timeout: float):
+        self.steps[name]["status"] = "running"
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(step(), timeout)
+            self.steps[name]["status"] = "ok"
+            self.steps[name].pop("error", None)
+            if detail is not None:
+                self.steps[name]["detail"] = detail
+        except Exception as e:
+            self.steps[name]["status"] = "failed"
+            self.steps[name]["error"] = str(e) or type(e).__name__
+            logger.warning("⚠️  Warm-up step %s failed: %s", name, self.steps[name]["error"])
+        self.steps[name]["seconds"] = round(time.perf_counter() - started, 3)
+
+    async def run(self):
+        for name, step, timeout, _ in self._plan:
+            await self._run_step(name, step, timeout)
+        self.finished = True
+        logger.info("🔥 Warm-up finished in %.1fs", time.time() - self.started_at)
+
+        delay = RETRY_BASE_SECONDS
+        while failed := [plan for plan in self._plan if plan[3] and self.steps[plan[0]]["status"] == "failed"]:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_SECONDS)
+            for name, step, timeout, _ in failed:
+                self.steps[name]["retries"] = self.steps[name].get("retries", 0) + 1
+                await self._run_step(name, step, timeout)
+                if self.steps[name]["status"] == "ok":
+                    logger.info("✅ Required warm-up step %s succeeded on retry %d", name, self.steps[name]["retries"])
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and all(step["status"] == "ok" for step in self.steps.values() if step["required"])
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, "finished": self.finished, "steps": self.steps}